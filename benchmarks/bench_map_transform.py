@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark the map coordinate transform.
+
+Compare the per point transform with the batched PointTable (NumPy and
+array fallback) on a large synthetic map, run it from the repository
+root with PYTHONPATH=. python benchmarks/bench_map_transform.py
+"""
+import math
+import timeit
+
+from irbt import map_renderer
+
+NUMBER = 5
+POINTS = 100000
+REGIONS = 200
+
+
+def synthetic_map(points=POINTS, regions=REGIONS):
+    """Return a map of regions shaped as circles sharing the points."""
+    per_region = points // regions
+    points2d = []
+    shapes = []
+    for region in range(regions):
+        cx, cy = (region % 20) * 5.0, (region // 20) * 5.0
+        ids = []
+        for index in range(per_region):
+            angle = 2 * math.pi * index / per_region
+            pid = len(points2d)
+            points2d.append({'id': pid, 'coordinates': [
+                cx + 2 * math.cos(angle), cy + 2 * math.sin(angle)]})
+            ids.append(pid)
+        shapes.append({'geometry': {'ids': [ids]},
+                       'region_type': 'kitchen', 'name': 'r%d' % region})
+    return {'maps': [{'points2d': points2d, 'regions': shapes,
+                      'map_header': {'name': 'synthetic'}}]}
+
+
+def _old_resolve(id_rings, point_lookup):
+    # _resolve_polygon_ids before the point table
+    rings = []
+    for ring in id_rings:
+        coords = []
+        for pid in ring:
+            if str(pid) in point_lookup:
+                coords.append(point_lookup[str(pid)])
+        if coords:
+            rings.append(coords)
+    return rings
+
+
+def _old_transform(coords, width=1600):
+    # bounds from two python lists and one call per point
+    xs = [c[0] for c in coords]
+    ys = [c[1] for c in coords]
+    bounds = min(xs), min(ys), max(xs), max(ys)
+    scale, x_min, y_min, _, img_h = map_renderer._compute_transform(
+        bounds, width)
+    t_args = (scale, x_min, y_min, 60, img_h)
+    return t_args, [map_renderer._transform_point(c, *t_args)
+                    for c in coords]
+
+
+def _new_transform(points, width=1600):
+    scale, x_min, y_min, _, img_h = map_renderer._compute_transform(
+        points.bounds(), width)
+    return points.transform(scale, x_min, y_min, 60, img_h)
+
+
+def per_point(map_entry, width=1600):
+    """Transform the regions as render_map did, one point at a time."""
+    point_lookup = {str(p['id']): tuple(p['coordinates'])
+                    for p in map_entry['points2d']}
+    t_args, _ = _old_transform(list(point_lookup.values()), width)
+    for region in map_entry['regions']:
+        for ring in _old_resolve(region['geometry']['ids'], point_lookup):
+            [map_renderer._transform_point(c, *t_args) for c in ring]
+
+
+def batched(map_entry, width=1600):
+    """Transform the point table at once and look the regions up."""
+    points = map_renderer.PointTable.from_points2d(map_entry['points2d'])
+    scale, x_min, y_min, _, img_h = map_renderer._compute_transform(
+        map_renderer._collect_bounds(map_entry, points), width)
+    point_lookup = points.pixel_lookup(scale, x_min, y_min, 60, img_h)
+    for region in map_entry['regions']:
+        map_renderer._resolve_polygon_ids(region['geometry']['ids'],
+                                          point_lookup)
+
+
+def _run(name, per_point_stage, batched_stage):
+    numpy = map_renderer.numpy
+    results = {'per point': timeit.timeit(per_point_stage, number=NUMBER)}
+    if numpy is not None:
+        results['batched (numpy)'] = timeit.timeit(batched_stage,
+                                                   number=NUMBER)
+    map_renderer.numpy = None
+    results['batched (array)'] = timeit.timeit(batched_stage,
+                                               number=NUMBER)
+    map_renderer.numpy = numpy
+    print(name)
+    for label, seconds in results.items():
+        print('  {:18} {:8.2f} ms/map  speedup: {:.2f}x'.format(
+            label, seconds / NUMBER * 1e3, results['per point'] / seconds))
+
+
+def main():
+    """Time the transforms of the synthetic map."""
+    map_entry = synthetic_map()['maps'][0]
+    coords = [tuple(p['coordinates']) for p in map_entry['points2d']]
+    tables = {}
+
+    def table():
+        # built once per mode, the table is the stored form of the map
+        key = map_renderer.numpy is None
+        if key not in tables:
+            tables[key] = map_renderer.PointTable(coords)
+        return tables[key]
+
+    print('{} points, {} regions'.format(POINTS, REGIONS))
+    _run('bounds and transform of the points',
+         lambda: _old_transform(coords), lambda: _new_transform(table()))
+    _run('render_map geometry (table build and id lookups included)',
+         lambda: per_point(map_entry), lambda: batched(map_entry))
+
+
+if __name__ == '__main__':
+    main()
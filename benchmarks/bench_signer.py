@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Benchmark the request signing.
+
+Compare irbt.signer.SigV4Auth with aws_requests_auth, run it from the
+repository root with PYTHONPATH=. python benchmarks/bench_signer.py
+"""
+import timeit
+
+from aws_requests_auth.aws_auth import AWSRequestsAuth
+
+from irbt.signer import SigV4Auth
+
+import requests
+
+NUMBER = 20000
+URL = ('https://api.example.com/v1/1234ABCD1234ABCD1234ABCD1234ABCD/pmaps'
+       '?visible=true&activeDetails=1')
+
+
+def main():
+    """Sign the same request with both signers."""
+    request = requests.Request('GET', URL).prepare()
+    reference = AWSRequestsAuth(
+        aws_access_key='AKID', aws_secret_access_key='SECRET',
+        aws_token='TOKEN' * 100, aws_host='api.example.com',
+        aws_region='us-east-1', aws_service='execute-api')
+    signer = SigV4Auth('AKID', 'SECRET', 'TOKEN' * 100, 'api.example.com',
+                       'us-east-1')
+    results = {
+        'aws_requests_auth': timeit.timeit(
+            lambda: reference.get_aws_request_headers_handler(request),
+            number=NUMBER),
+        'irbt.signer': timeit.timeit(
+            lambda: signer.sign_request(request), number=NUMBER)
+    }
+    for name, seconds in results.items():
+        print('{:20} {:8.2f} us/request'.format(
+            name, seconds / NUMBER * 1e6))
+    print('speedup: {:.2f}x'.format(
+        results['aws_requests_auth'] / results['irbt.signer']))
+
+
+if __name__ == '__main__':
+    main()
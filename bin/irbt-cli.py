@@ -9,8 +9,8 @@ import json
 import os
 import sys
 
-from irbt import (Cloud, Robot, enable_mqtt_logging, get_argument_parser,
-                  logging)
+from irbt import (Cloud, CredentialCache, Robot, enable_mqtt_logging,
+                  get_argument_parser, logging)
 
 
 def print_output(payload, response_status, token):
@@ -48,7 +48,11 @@ if not username or not password:
     exit(1)
 
 # cloud connexion
-cloud = Cloud(username=username, password=password)
+credential_cache = None
+if args.credential_cache:
+    credential_cache = CredentialCache(args.credential_cache)
+cloud = Cloud(username=username, password=password,
+              credential_cache=credential_cache)
 
 # associate robot
 if args.associate:
@@ -93,7 +97,9 @@ elif args.robot_infos:
         sys.exit(0)
 
 # instance robot !
-robot = Robot(rid=args.robot_id, cloud=cloud, output_raw=args.output_raw)
+# nothing is retrieved until needed, commands skip the maps
+robot = Robot(rid=robot_id, cloud=cloud, output_raw=args.output_raw,
+              output_window=args.output_window)
 
 # list rooms
 if args.list_rooms:
@@ -116,12 +122,20 @@ elif args.map:
 elif args.map_image:
     try:
         from irbt.map_renderer import render_map
+        from irbt.render_cache import RenderCache
     except ImportError:
         logger.error('Pillow is required for map rendering. '
                      'Install it with: pip install Pillow')
         sys.exit(1)
-    map_data = robot.vector_map()
-    render_map(map_data, output_path=args.map_image)
+    if args.map_image.endswith('.svg'):
+        if args.render_cache:
+            logger.error('The render cache only keeps PNG images')
+            sys.exit(1)
+        render_map(robot.vector_map(), args.map_image, image_format='svg')
+    else:
+        cache = RenderCache(args.render_cache) if args.render_cache else None
+        with open(args.map_image, 'wb') as fh:
+            fh.write(robot.map_image(cache=cache))
     print('Map saved to {}'.format(args.map_image))
 # commands
 elif args.cmd:
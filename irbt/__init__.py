@@ -4,8 +4,19 @@ This is a library to interact with iRbt cloud.
 Use it to retrieve informations and command your iRbt appliances.
 """
 
+from .aio import AsyncCloud, AsyncRobot  # noqa: F401
 from .cloud import Cloud  # noqa: F401
+from .credential_cache import CredentialCache  # noqa: F401
+from .dispatch import (AsyncioDispatcher, InlineDispatcher,  # noqa: F401
+                       ThreadDispatcher)
+from .exceptions import CircuitOpenError, CloudAPIGetError  # noqa: F401
+from .fleet import DispatchResult, Fleet  # noqa: F401
 from .logger import enable_mqtt_logging, logging  # noqa: F401
-from .map_renderer import render_map  # noqa: F401
+from .map_renderer import MapTiles, render_map  # noqa: F401
+from .mqtt import MqttConnectionManager  # noqa: F401
 from .parse_command_line import get_argument_parser  # noqa: F401
-from .robot import Robot  # noqa: F401
+from .render_cache import RenderCache  # noqa: F401
+from .response_cache import ResponseCache  # noqa: F401
+from .retry import CircuitBreaker, RetryPolicy  # noqa: F401
+from .robot import CommandAck, Robot  # noqa: F401
+from .store import SyncStore  # noqa: F401
@@ -0,0 +1,475 @@
+"""
+Asyncio cloud and robot classes.
+
+They mirror Cloud and Robot on top of aiohttp, so many robots can be
+polled concurrently from a single event loop
+"""
+import asyncio
+import json
+import time
+
+import requests
+
+from .cloud import Cloud, REFRESH_RETRY_DELAY
+from .exceptions import CloudAPIGetError
+from .logger import logging
+from .robot import FETCH_ENDPOINTS, FetchResult, RobotEndpoints
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:  # aiohttp is an optional dependency
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCloud(Cloud):
+    """
+    AsyncCloud class.
+
+    Asyncio version of Cloud, the login has to be awaited, either
+    explicitly or by using the instance as an async context manager
+    """
+
+    class Api:
+        """
+        Api class.
+
+        Asyncio HTTP cloud api
+        """
+
+        cloud = None
+
+        def __init__(self, cloud):
+            """Init our cloud."""
+            self.cloud = cloud
+
+        async def _get(self, url, params, auth, headers=None):
+            # sign the request exactly as it is sent
+            request = requests.Request('GET', url, params=params).prepare()
+            headers = dict(headers or {})
+            headers.update(auth.sign_request(request))
+            session = self.cloud._get_session()
+            return await session.get(yarl.URL(request.url, encoded=True),
+                                     headers=headers)
+
+        async def _send(self, url, params, auth, headers, endpoint):
+            # send the request, retrying the transient errors
+            policy = self.cloud.retry_policy
+            attempt = 0
+            while True:
+                try:
+                    response = await self._get(url, params, auth, headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt >= policy.max_retries:
+                        if self.cloud.circuit_breaker:
+                            self.cloud.circuit_breaker.failure(endpoint)
+                        raise
+                    delay = policy.delay(attempt)
+                    logger.warning('%s failed (%s), retrying in %.1fs',
+                                   endpoint, e, delay)
+                else:
+                    retryable = policy.is_retryable(response.status)
+                    if not retryable or attempt >= policy.max_retries:
+                        return response
+                    delay = policy.delay(attempt,
+                                         response.headers.get('Retry-After'))
+                    logger.warning('%s returned %d, retrying in %.1fs',
+                                   endpoint, response.status, delay)
+                    response.release()
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        async def get(self, *a, params=None, as_json=True):
+            """
+            HTTP GET.
+
+            Authenticated GET method, the response body is read
+            when as_json is False
+            """
+            parts = [
+                self.cloud._disc_api['httpBaseAuth'],
+                self.cloud._api_version
+            ]
+            parts.extend(a)
+
+            cache = self.cloud.response_cache if as_json else None
+            entry = None
+            headers = None
+            if cache:
+                key = cache.key(a, params)
+                entry = cache.lookup(key)
+                if entry and entry.is_fresh():
+                    return entry.value
+                if entry:
+                    headers = entry.validators()
+
+            endpoint = '/'.join(a)
+            breaker = self.cloud.circuit_breaker
+            if breaker:
+                breaker.before(endpoint)
+            auth = self.cloud.auth
+            response = await self._send('/'.join(parts), params, auth,
+                                        headers, endpoint)
+            if response.status == 403:
+                response.release()
+                logger.error('Authentication failed, provided aws '
+                             'credentials are unauthorized for the '
+                             'requested endpoint: %s', '/'.join(parts))
+                if not await self.cloud.renew_credentials(auth):
+                    raise CloudAPIGetError(403, endpoint)
+                response = await self._send('/'.join(parts), params,
+                                            self.cloud.auth, headers,
+                                            endpoint)
+            if breaker:
+                if self.cloud.retry_policy.is_retryable(response.status):
+                    breaker.failure(endpoint)
+                else:
+                    breaker.success(endpoint)
+            async with response:
+                if response.status == 304 and entry:
+                    return cache.revalidated(key, entry)
+                if response.status != 200:
+                    raise CloudAPIGetError(response.status, endpoint)
+                body = await response.read()
+            if as_json:
+                value = json.loads(body)
+                if cache:
+                    cache.store(key, value, response.headers)
+                return value
+            return body
+
+    def __init__(self, username=None, password=None, pool_connections=100,
+                 pool_maxsize=10, keep_alive=True, credential_cache=None,
+                 refresh_margin=300, response_cache=None,
+                 retry_policy=None, circuit_breaker=None):
+        """
+        Initialize usefull params.
+
+        Nothing is sent before the login is awaited, pool_connections is
+        the total number of connections and pool_maxsize the number of
+        connections per host, the other params are the ones of Cloud
+        """
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for the asyncio api, '
+                              'install it with: pip install aiohttp')
+        self._pool = (pool_connections, pool_maxsize, keep_alive)
+        self._session = None
+        self._async_login_lock = asyncio.Lock()
+        self._refresh_task = None
+        super().__init__(credential_cache=credential_cache,
+                         refresh_margin=refresh_margin,
+                         response_cache=response_cache,
+                         retry_policy=retry_policy,
+                         circuit_breaker=circuit_breaker)
+        self.username = username
+        self.password = password
+        self.api = AsyncCloud.Api(self)
+
+    @staticmethod
+    def _make_session(*args):
+        # the aiohttp session is created in the event loop, see _get_session
+        return None
+
+    def _get_session(self):
+        if self._session is None:
+            limit, limit_per_host, keep_alive = self._pool
+            connector = aiohttp.TCPConnector(limit=limit,
+                                             limit_per_host=limit_per_host,
+                                             force_close=not keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """Close the pooled http and mqtt connections."""
+        self.stop_auto_refresh()
+        self.mqtt.close()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        """Login if credentials were provided."""
+        if self.username and self.password and self.auth is None:
+            if await self.login(self.username, self.password) is not True:
+                raise Exception('CloudLoginError')
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Close the connections."""
+        await self.close()
+
+    async def _post_json(self, url, data):
+        async with self._get_session().post(url, data=data) as response:
+            return json.loads(await response.text())
+
+    async def _disc(self):
+        params = {
+            'country_code': 'FR'
+        }
+        async with self._get_session().get(
+                'https://disc-prod.iot.irobotapi.com/v1/app/discover',
+                params=params) as response:
+            disc_api = json.loads(await response.text())
+        return self._set_disc(disc_api)
+
+    async def _gigya_login(self, username, password):
+        gigya_login_data = {
+            'ApiKey': self._api_key,
+            'ctag': 'webbridge',
+            'format': 'json',
+            'loginID': username,
+            'password': password,
+            'sessionExpiration': '-2',
+            'targetEnv': 'mobile'
+        }
+        return await self._post_json(
+            'https://accounts.us1.gigya.com/accounts.login',
+            gigya_login_data)
+
+    async def _irbt_login_api(self, signature, timestamp, uid):
+        data = {
+            'assume_robot_ownership': '0',
+            'signature': signature,
+            'timestamp': timestamp,
+            'app_id': self.app_id,
+            'uid': uid
+        }
+        unauth_api = await self._post_json(
+            self._http_base + '/v1/login/account', json.dumps(data))
+        return (
+            unauth_api['credentials']['AccessKeyId'],
+            unauth_api['credentials']['SecretKey'],
+            unauth_api['credentials']['SessionToken'],
+            self._parse_expiration(
+                unauth_api['credentials'].get('Expiration')))
+
+    async def login(self, username, password, use_cache=True):
+        """
+        Retrieve the aws credentials used by the apis.
+
+        Same stages as Cloud.login, without blocking the event loop
+        """
+        async with self._async_login_lock:
+            return await self._login(username, password, use_cache)
+
+    async def _login(self, username, password, use_cache):
+        if self.credential_cache and use_cache:
+            if self._login_from_cache(username):
+                return True
+        await self._disc()
+        gigya_login = await self._gigya_login(username, password)
+        try:
+            credentials = await self._irbt_login_api(
+                gigya_login['UIDSignature'],
+                gigya_login['signatureTimestamp'],
+                gigya_login['UID'])
+        except KeyError:
+            logger.error('Authentication failed, wrong login/password')
+            return -1
+        self._set_credentials(*credentials)
+        if self.credential_cache:
+            self.credential_cache.save(username, self._disc_api,
+                                       self.access_key_id, self.secret_key,
+                                       self.session_token,
+                                       self.credentials_expiration)
+        return True
+
+    async def refresh_credentials(self):
+        """Renew the aws credentials now."""
+        return await self.login(username=self.username,
+                                password=self.password,
+                                use_cache=False) is True
+
+    async def renew_credentials(self, stale_auth):
+        """
+        Renew the credentials once for all the callers.
+
+        Coroutines waiting for the same stale auth reuse the result
+        of the first renewal
+        """
+        async with self._async_login_lock:
+            if self.auth is not stale_auth:
+                return True
+            failed_auth, failed_at = self._failed_renewal
+            recently_failed = time.time() - failed_at < REFRESH_RETRY_DELAY
+            if failed_auth is stale_auth and recently_failed:
+                return False
+            if await self._login(self.username, self.password,
+                                 use_cache=False) is True:
+                return True
+            self._failed_renewal = (stale_auth, time.time())
+            return False
+
+    def start_auto_refresh(self):
+        """
+        Renew the credentials in the background before they expire.
+
+        It must be called from the running event loop
+        """
+        self.stop_auto_refresh()
+        self._refresh_task = asyncio.ensure_future(self._refresh_loop())
+
+    def stop_auto_refresh(self):
+        """Stop the background renewal of the credentials."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            delay = 0
+            if self.credentials_expiration is not None:
+                renew_at = self.credentials_expiration - self.refresh_margin
+                delay = max(0, renew_at - time.time())
+            await asyncio.sleep(delay)
+            try:
+                renewed = await self.refresh_credentials()
+            except Exception as e:
+                logger.error('background credentials renewal failed: %s', e)
+                renewed = False
+            if not renewed:
+                await asyncio.sleep(REFRESH_RETRY_DELAY)
+
+    async def assoc(self, password, robot_id):
+        """
+        Associate provided robotid and password to the account.
+
+        It only needs to be done once
+        """
+        url = self.service_url + 'user/associations/robots/%s?app_id=%s' % (
+            robot_id, self.app_id)
+        request = requests.Request('POST', url, json={'password': password})
+        request = request.prepare()
+        headers = dict(request.headers)
+        headers.update(self.auth.sign_request(request))
+        async with self._get_session().post(
+                yarl.URL(request.url, encoded=True), data=request.body,
+                headers=headers) as response:
+            body = await response.read()
+        if self.response_cache and 200 <= response.status < 300:
+            # the robot list changed
+            self.response_cache.invalidate('user', 'associations', 'robots')
+        return body
+
+    async def robots(self):
+        """
+        Return a list of robots provided by the api.
+
+        The first json key is the robot id
+        """
+        return await self.api.get('user', 'associations', 'robots')
+
+
+class AsyncRobot(RobotEndpoints):
+    """
+    Class AsyncRobot.
+
+    Asyncio version of the Robot cloud api, it needs an AsyncCloud
+    """
+
+    def __init__(self, cloud=None, rid=None):
+        """
+        Initialize the robot instance.
+
+        No request is sent, use create() or prefetch() to retrieve
+        the robot id and the current map
+        """
+        if not cloud:
+            raise Exception('You need to provide a cloud connection')
+        self._cloud = cloud
+        self._id = rid
+        self._current_map_id = None
+        self._current_user_pmapv_id = None
+
+    @classmethod
+    async def create(cls, cloud, rid=None):
+        """Return a robot with its id and current map set."""
+        robot = cls(cloud, rid)
+        await robot.prefetch()
+        return robot
+
+    async def prefetch(self):
+        """Retrieve the robot id (first robot if none) and the maps."""
+        if not self._id:
+            self._id = list(await self._cloud.robots())[0]
+        await self.maps()
+
+    async def maps(self):
+        """
+        Return the map lists.
+
+        Used to return a map lists and to set the active one in the instance
+        """
+        parts, params = self._maps_query()
+        maps = await self._cloud.api.get(*parts, params=params)
+        self._set_current_map(maps)
+        return maps
+
+    async def rooms(self):
+        """Return the room lists."""
+        await self.maps()
+        return self._map_index.regions
+
+    async def missions(self):
+        """Return achieved mission list."""
+        parts, params = self._missions_query()
+        return await self._cloud.api.get(*parts, params=params)
+
+    async def evac_history(self, max_age=90):
+        """Return logs of evacuations of the last max_age days."""
+        parts, params = self._evac_history_query(max_age)
+        return await self._cloud.api.get(*parts, params=params)
+
+    async def timeline(self):
+        """Return event timeline."""
+        parts, params = self._timeline_query()
+        return await self._cloud.api.get(*parts, params=params)
+
+    async def vector_map(self, map_id=None, user_pmapv_id=None):
+        """Return a map as json."""
+        if not map_id and not self._current_map_id:
+            await self.maps()
+        parts, params = self._vector_map_query(map_id, user_pmapv_id)
+        return await self._cloud.api.get(*parts, params=params)
+
+    async def fetch_all(self, endpoints=FETCH_ENDPOINTS, max_concurrency=5):
+        """
+        Retrieve several endpoints concurrently.
+
+        Same result as Robot.fetch_all
+        """
+        for endpoint in endpoints:
+            if endpoint not in FETCH_ENDPOINTS:
+                raise ValueError('Unknown endpoint %s' % endpoint)
+        if not self._id:
+            self._id = list(await self._cloud.robots())[0]
+        semaphore = asyncio.Semaphore(max_concurrency)
+        # vector_map waits for the current map retrieved by maps
+        deferred = 'maps' in endpoints and not self._current_map_id
+        deferred = deferred and 'vector_map' in endpoints
+        maps_done = asyncio.Event()
+
+        async def fetch(endpoint):
+            if deferred and endpoint == 'vector_map':
+                await maps_done.wait()
+            try:
+                async with semaphore:
+                    return await getattr(self, endpoint)()
+            finally:
+                if endpoint == 'maps':
+                    maps_done.set()
+
+        responses = await asyncio.gather(
+            *[fetch(endpoint) for endpoint in endpoints],
+            return_exceptions=True)
+        results = {}
+        errors = {}
+        for endpoint, response in zip(endpoints, responses):
+            if isinstance(response, Exception):
+                logger.error('fetching %s failed: %s', endpoint, response)
+                errors[endpoint] = response
+            else:
+                results[endpoint] = response
+        return FetchResult(results, errors)
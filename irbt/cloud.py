@@ -3,23 +3,37 @@ Cloud class for authentication and connexion setup.
 
 It allow interactions with the irbt cloud api
 """
+import datetime
 import json
+import threading
+import time
 from urllib.parse import urlparse
 
-from aws_requests_auth.aws_auth import AWSRequestsAuth
-
 import requests
+from requests.adapters import HTTPAdapter
 
+from .exceptions import CloudAPIGetError
 from .logger import logging
+from .mqtt import MqttConnectionManager, ROBOTS_PER_CONNECTION
+from .retry import RetryPolicy
+from .signer import SigV4Auth
 
 logger = logging.getLogger(__name__)
 
+# used when the login api does not tell when the credentials expire
+DEFAULT_CREDENTIALS_LIFETIME = 3600
+# delay before trying again when a background renewal failed
+REFRESH_RETRY_DELAY = 30
+
 
 class Cloud:
     """
     Cloud class.
 
     It allow interactions with the irbt cloud api
+    An instance can be shared by several threads: the http connections
+    are pooled, the credentials are swapped atomically and an expired
+    session is renewed by a single login that the other callers wait for.
     """
 
     api = None
@@ -37,11 +51,14 @@ class Cloud:
             """Init our cloud."""
             self.cloud = cloud
 
-        def get(self, *a, params=None, as_json=True):
+        def get(self, *a, params=None, as_json=True, stream=False):
             """
             HTTP GET.
 
-            Authenticated GET method
+            Authenticated GET method, json responses go through the
+            response cache of the cloud when there is one.
+            With stream the body is not downloaded before the response
+            is returned, as_json must then be False.
             """
             parts = [
                 self.cloud._disc_api['httpBaseAuth'],
@@ -49,43 +66,118 @@ class Cloud:
             ]
             parts.extend(a)
 
-            response = requests.get('/'.join(parts),
-                                    params=params,
-                                    auth=self.cloud.auth)
-            if response.status_code != 200:
-                if response.status_code == 403:
-                    logger.error('Authentication failed, provided aws '
-                                 'credentials are unauthorized for the '
-                                 'requested endpoint: %s',
-                                 '/'.join(parts))
-                    logger.error('Possible token expiration, trying renewal:')
-                    if self.cloud.login(username=self.cloud.username,
-                                        password=self.cloud.password):
-                        logger.error('renewal successfull')
-                        response = requests.get('/'.join(parts),
-                                                params=params,
-                                                auth=self.cloud.auth)
-                        if response.status_code != 200:
-                            raise Exception('CloudAPIGetError<{}>'.format(
-                                response.status_code))
-                    else:
-                        logger.error('something wrong, cannot login.')
-                    # return self.get(a, params, as_json)
+            cache = self.cloud.response_cache if as_json else None
+            entry = None
+            headers = None
+            if cache:
+                key = cache.key(a, params)
+                entry = cache.lookup(key)
+                if entry and entry.is_fresh():
+                    return entry.value
+                if entry:
+                    headers = entry.validators()
+
+            endpoint = '/'.join(a)
+            breaker = self.cloud.circuit_breaker
+            if breaker:
+                breaker.before(endpoint)
+            auth = self.cloud.auth
+            response = self._send('/'.join(parts), params, headers, auth,
+                                  endpoint, stream)
+            if response.status_code == 403:
+                logger.error('Authentication failed, provided aws '
+                             'credentials are unauthorized for the '
+                             'requested endpoint: %s',
+                             '/'.join(parts))
+                logger.error('Possible token expiration, trying renewal:')
+                response.close()
+                if not self.cloud.renew_credentials(auth):
+                    logger.error('something wrong, cannot login.')
+                    raise CloudAPIGetError(403, endpoint)
+                logger.error('renewal successfull')
+                response = self._send('/'.join(parts), params, headers,
+                                      self.cloud.auth, endpoint, stream)
+            if breaker:
+                # only the server side errors count as failures
+                if self.cloud.retry_policy.is_retryable(
+                        response.status_code):
+                    breaker.failure(endpoint)
                 else:
-                    raise Exception('CloudAPIGetError<{}>'.format(
-                        response.status_code))
+                    breaker.success(endpoint)
+            if response.status_code == 304 and entry:
+                return cache.revalidated(key, entry)
+            if response.status_code != 200:
+                response.close()
+                raise CloudAPIGetError(response.status_code, endpoint)
             if as_json:
-
-                return response.json()
+                value = response.json()
+                if cache:
+                    cache.store(key, value, response.headers)
+                return value
             return response
 
-    def __init__(self, username=None, password=None):
+        def _send(self, url, params, headers, auth, endpoint, stream=False):
+            # send the request, retrying the transient errors
+            policy = self.cloud.retry_policy
+            attempt = 0
+            while True:
+                try:
+                    response = self.cloud.session.get(url, params=params,
+                                                      headers=headers,
+                                                      auth=auth,
+                                                      stream=stream)
+                except requests.RequestException as e:
+                    transient = isinstance(e, (requests.ConnectionError,
+                                               requests.Timeout))
+                    if not transient or attempt >= policy.max_retries:
+                        if self.cloud.circuit_breaker:
+                            self.cloud.circuit_breaker.failure(endpoint)
+                        raise
+                    delay = policy.delay(attempt)
+                    logger.warning('%s failed (%s), retrying in %.1fs',
+                                   endpoint, e, delay)
+                else:
+                    retryable = policy.is_retryable(response.status_code)
+                    if not retryable or attempt >= policy.max_retries:
+                        return response
+                    delay = policy.delay(attempt,
+                                         response.headers.get('Retry-After'))
+                    logger.warning('%s returned %d, retrying in %.1fs',
+                                   endpoint, response.status_code, delay)
+                    response.close()
+                time.sleep(delay)
+                attempt += 1
+
+    def __init__(self, username=None, password=None, pool_connections=10,
+                 pool_maxsize=10, pool_block=False, keep_alive=True,
+                 credential_cache=None, auto_refresh=False,
+                 refresh_margin=300, response_cache=None,
+                 retry_policy=None, circuit_breaker=None,
+                 mqtt_robots_per_connection=ROBOTS_PER_CONNECTION):
         """
         Initialize usefull params.
 
         Use user credentials to call the login method during the init
         if provided.
+        The http connection pool is shared by every call made through
+        this instance, pool_connections is the number of hosts kept
+        in the pool, pool_maxsize the number of connections kept per host
+        and pool_block makes callers wait for a free connection instead
+        of opening extra ones. keep_alive=False closes the connections
+        after each request.
+        When a CredentialCache is provided, the login reuses the
+        credentials it holds as long as they are valid.
+        auto_refresh renews the credentials in the background
+        refresh_margin seconds before they expire.
+        response_cache is an optional ResponseCache used by api.get.
+        The api calls are retried according to retry_policy (a default
+        RetryPolicy when None) and fail fast while the optional
+        circuit_breaker is open for their endpoint.
+        The mqtt connections are shared by the robots through
+        self.mqtt, mqtt_robots_per_connection robots per connection.
         """
+        self.session = self._make_session(pool_connections, pool_maxsize,
+                                          pool_block, keep_alive)
         self._disc_api = None
         self._api_version = 'v1'
         self.service_url = None
@@ -101,6 +193,19 @@ class Cloud:
         self.access_key_id = None
         self.secret_key = None
         self.session_token = None
+        self.credentials_expiration = None
+        self.credential_cache = credential_cache
+        self.response_cache = response_cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.refresh_margin = refresh_margin
+        self._auth_lock = threading.RLock()
+        # serialize the logins, see renew_credentials
+        self._login_lock = threading.RLock()
+        self._failed_renewal = (None, 0)
+        self._credentials_listeners = []
+        self._refresh_timer = None
+        self.mqtt = MqttConnectionManager(self, mqtt_robots_per_connection)
         self.shadow_client = None
         self.device = None
         self.username = None
@@ -113,17 +218,45 @@ class Cloud:
             # then login
             self.login(username=username, password=password)
         self.api = Cloud.Api(self)
+        if auto_refresh:
+            self.start_auto_refresh()
+
+    @staticmethod
+    def _make_session(pool_connections, pool_maxsize, pool_block,
+                      keep_alive):
+        """Create the http session and its connection pool."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              pool_block=pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """Close the pooled http and mqtt connections."""
+        self.stop_auto_refresh()
+        self.mqtt.close()
+        self.session.close()
+
     # discover the current api and mqtt params
 
     def _disc(self):
         params = {
             'country_code': 'FR'
         }
-        self._disc_api = json.loads(
-            requests.get(
+        disc_api = json.loads(
+            self.session.get(
                 'https://disc-prod.iot.irobotapi.com/v1/app/discover',
                 params=params)
             .content.decode('utf-8'))
+        return self._set_disc(disc_api)
+
+    # set the api and mqtt params from a discovery document
+    def _set_disc(self, disc_api):
+        self._disc_api = disc_api
 
         # check if all the needed keys are there
         api_keys = ['gigya', 'httpBaseAuth', 'httpBase', 'awsRegion',
@@ -167,7 +300,7 @@ class Cloud:
                     'targetEnv': 'mobile'
         }
         return json.loads(
-            requests.post(
+            self.session.post(
                 # default login  url for gigya :
                 # https://developers.gigya.com/display/GD/accounts.linkAccounts+REST
                 'https://accounts.us1.gigya.com/accounts.login',
@@ -185,24 +318,103 @@ class Cloud:
         }
         # retrieve the aws credentials
         unauth_api = json.loads(
-            requests.post(
+            self.session.post(
                 self._http_base + '/v1/login/account',
                 data=json.dumps(data))
             .content.decode('utf-8'))
         return (
             unauth_api['credentials']['AccessKeyId'],
             unauth_api['credentials']['SecretKey'],
-            unauth_api['credentials']['SessionToken'])
+            unauth_api['credentials']['SessionToken'],
+            self._parse_expiration(
+                unauth_api['credentials'].get('Expiration')))
+
+    # return the expiration of the credentials as a timestamp
+    @staticmethod
+    def _parse_expiration(expiration):
+        if isinstance(expiration, (int, float)):
+            # some apis return milliseconds
+            return expiration / 1000 if expiration > 1e11 else expiration
+        if isinstance(expiration, str):
+            try:
+                return datetime.datetime.fromisoformat(
+                    expiration).timestamp()
+            except ValueError:
+                logger.warning('unknown credentials expiration format %s',
+                               expiration)
+        return time.time() + DEFAULT_CREDENTIALS_LIFETIME
+
+    # replace the credentials and the auth built from them at once,
+    # then tell the listeners (mqtt clients) about them
+    def _set_credentials(self, access_key_id, secret_key, session_token,
+                         expiration):
+        # set the aws authentication headers
+        # (Signature Version 4 Signing Process)
+        auth = SigV4Auth(access_key_id, secret_key, session_token,
+                         self._aws_host, self._aws_region, 'execute-api')
+        with self._auth_lock:
+            self.access_key_id = access_key_id
+            self.secret_key = secret_key
+            self.session_token = session_token
+            self.credentials_expiration = expiration
+            self.auth = auth
+            listeners = list(self._credentials_listeners)
+        for listener in listeners:
+            try:
+                listener(access_key_id, secret_key, session_token)
+            except Exception as e:
+                logger.error('credentials listener failed: %s', e)
+
+    def credentials(self):
+        """Return the current (access_key_id, secret_key, session_token)."""
+        with self._auth_lock:
+            return (self.access_key_id, self.secret_key, self.session_token)
+
+    def add_credentials_listener(self, listener):
+        """
+        Register a callback called when the credentials are renewed.
+
+        It receives the access key id, the secret key and the session token
+        """
+        with self._auth_lock:
+            if listener not in self._credentials_listeners:
+                self._credentials_listeners.append(listener)
+
+    def remove_credentials_listener(self, listener):
+        """Unregister a credentials callback."""
+        with self._auth_lock:
+            if listener in self._credentials_listeners:
+                self._credentials_listeners.remove(listener)
+
+    # reuse the cached credentials of username if any
+    def _login_from_cache(self, username):
+        entry = self.credential_cache.load(username)
+        if not entry or self._set_disc(entry['disc_api']) == -1:
+            return False
+        self._set_credentials(entry['access_key_id'], entry['secret_key'],
+                              entry['session_token'], entry['expiration'])
+        logger.debug('using cached credentials of %s', username)
+        return True
 
     # login to the irbt cloud
-    def login(self, username, password):
+    def login(self, username, password, use_cache=True):
         """
         Retrieve the aws credentials used by the apis.
 
         The login is staged, p1 we login to gigya, p2 we use p1 credentials
         in irbt login api, that finally return aws credentials to
         use in all the subsequent calls (mqtt and api gateway)
+        The stages are skipped when the credential cache holds valid
+        credentials, unless use_cache is False.
         """
+        with self._login_lock:
+            return self._login(username, password, use_cache)
+
+    def _login(self, username, password, use_cache):
+        if self.credential_cache and use_cache:
+            if self._login_from_cache(username):
+                return True
+
         # discover cloud settings
         self._disc()
 
@@ -211,26 +423,96 @@ class Cloud:
 
         # get aws keys through irbt login api
         try:
-            (self.access_key_id,
-             self.secret_key,
-             self.session_token) = self._irbt_login_api(
+            credentials = self._irbt_login_api(
                 gigya_login['UIDSignature'],
                 gigya_login['signatureTimestamp'],
                 gigya_login['UID'])
         except KeyError:
             logger.error('Authentication failed, wrong login/password')
             return -1
-        # use AWSRequestsAuth module to set the aws authentication headers
-        # (Signature Version 4 Signing Process)
-        self.auth = AWSRequestsAuth(
-            aws_access_key=self.access_key_id,
-            aws_secret_access_key=self.secret_key,
-            aws_token=self.session_token,
-            aws_host=self._aws_host,
-            aws_region=self._aws_region,
-            aws_service='execute-api')
+        self._set_credentials(*credentials)
+        if self.credential_cache:
+            self.credential_cache.save(username, self._disc_api,
+                                       self.access_key_id, self.secret_key,
+                                       self.session_token,
+                                       self.credentials_expiration)
         return True
 
+    def refresh_credentials(self):
+        """
+        Renew the aws credentials now.
+
+        A full login is done with the saved username and password
+        """
+        return self.login(username=self.username, password=self.password,
+                          use_cache=False) is True
+
+    def renew_credentials(self, stale_auth):
+        """
+        Renew the credentials once for all the callers.
+
+        stale_auth is the auth that was refused, when several threads
+        ask for a renewal at the same time only the first one logs in,
+        the others wait for it and reuse its result
+        """
+        with self._login_lock:
+            if self.auth is not stale_auth:
+                # already renewed by another caller
+                return True
+            failed_auth, failed_at = self._failed_renewal
+            recently_failed = time.time() - failed_at < REFRESH_RETRY_DELAY
+            if failed_auth is stale_auth and recently_failed:
+                return False
+            if self.refresh_credentials():
+                return True
+            self._failed_renewal = (stale_auth, time.time())
+            return False
+
+    def start_auto_refresh(self):
+        """
+        Renew the credentials in the background before they expire.
+
+        The renewal happens refresh_margin seconds before the expiration
+        so requests and mqtt reconnections never see expired credentials
+        """
+        with self._auth_lock:
+            self.stop_auto_refresh()
+            if self.credentials_expiration is None:
+                delay = 0
+            else:
+                renew_at = self.credentials_expiration - self.refresh_margin
+                delay = max(0, renew_at - time.time())
+            self._schedule_refresh(delay)
+
+    def stop_auto_refresh(self):
+        """Stop the background renewal of the credentials."""
+        with self._auth_lock:
+            if self._refresh_timer:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+
+    def _schedule_refresh(self, delay):
+        logger.debug('next credentials renewal in %ds', delay)
+        self._refresh_timer = threading.Timer(delay, self._auto_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _auto_refresh(self):
+        try:
+            renewed = self.refresh_credentials()
+        except Exception as e:
+            logger.error('background credentials renewal failed: %s', e)
+            renewed = False
+        with self._auth_lock:
+            if self._refresh_timer is None:
+                # stopped in the meantime
+                return
+            if renewed:
+                self._refresh_timer = None
+                self.start_auto_refresh()
+            else:
+                self._schedule_refresh(REFRESH_RETRY_DELAY)
+
     # Assoc
     def assoc(self, password, robot_id):
         """
@@ -239,10 +521,14 @@ class Cloud:
         It only needs to be done once
         """
         data = {'password': password}
-        return requests.post(
+        response = self.session.post(
             self.service_url + 'user/associations/robots/%s?app_id=%s'
             % (robot_id, self.app_id),
-            auth=self.auth, json=data).content
+            auth=self.auth, json=data)
+        if self.response_cache and 200 <= response.status_code < 300:
+            # the robot list changed
+            self.response_cache.invalidate('user', 'associations', 'robots')
+        return response.content
 
     # return a list of our robots
     def robots(self):
@@ -0,0 +1,91 @@
+"""
+Credential cache.
+
+Keep the discovery document and the aws credentials on disk between runs
+"""
+import json
+import os
+import time
+
+from .logger import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join('~', '.cache', 'irbt', 'credentials.json')
+
+
+class CredentialCache:
+    """
+    CredentialCache class.
+
+    Opt-in file store for the discovery document and the aws sts
+    credentials, indexed by username. The file is only readable by its
+    owner and entries are ignored once they are about to expire.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, margin=60):
+        """
+        Set the cache file path.
+
+        margin is the number of seconds before the expiration
+        from which the cached credentials are no longer used
+        """
+        self.path = os.path.expanduser(path)
+        self.margin = margin
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning('ignoring unreadable credential cache %s: %s',
+                           self.path, e)
+            return {}
+
+    def _write(self, entries):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(entries, fh)
+        os.replace(tmp_path, self.path)
+
+    def load(self, username):
+        """
+        Return the cached entry of username.
+
+        None is returned when there is no entry or when it is expired
+        """
+        entry = self._read().get(username)
+        if not entry:
+            return None
+        if entry.get('expiration', 0) - self.margin <= time.time():
+            logger.debug('cached credentials of %s are expired', username)
+            return None
+        return entry
+
+    def save(self, username, disc_api, access_key_id, secret_key,
+             session_token, expiration):
+        """Store the discovery document and the credentials of username."""
+        entries = self._read()
+        entries[username] = {
+            'disc_api': disc_api,
+            'access_key_id': access_key_id,
+            'secret_key': secret_key,
+            'session_token': session_token,
+            'expiration': expiration
+        }
+        self._write(entries)
+
+    def clear(self, username=None):
+        """Forget the entry of username, or all of them."""
+        entries = self._read()
+        if username is None:
+            entries = {}
+        elif entries.pop(username, None) is None:
+            return
+        self._write(entries)
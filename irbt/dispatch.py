@@ -0,0 +1,193 @@
+"""
+Callback dispatchers.
+
+Run the robot callbacks outside of the mqtt network thread
+"""
+import asyncio
+import threading
+from collections import deque
+
+from .logger import logging
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+
+class InlineDispatcher:
+    """
+    InlineDispatcher class.
+
+    Run the callbacks at once in the calling (mqtt) thread, the default
+    """
+
+    def submit(self, callback, *args):
+        """Run a callback."""
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error('callback %s failed: %s', callback, e)
+
+    def stats(self):
+        """Return the dispatch counters."""
+        return {'depth': 0, 'max_depth': 0}
+
+    def close(self):
+        """Nothing to release."""
+
+
+class QueueDispatcher:
+    """
+    QueueDispatcher class.
+
+    Bounded queue of callbacks, consumed by the subclasses.
+    When the queue is full, the drop_oldest policy discards the oldest
+    callback and the block policy makes the producer wait for room
+    """
+
+    def __init__(self, max_queue=1000, policy=DROP_OLDEST):
+        """Set the size of the queue and its backpressure policy."""
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError('Unknown policy %s' % policy)
+        self.max_queue = max_queue
+        self.policy = policy
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.max_depth = 0
+
+    def submit(self, callback, *args):
+        """Queue a callback, applying the policy if the queue is full."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Dispatcher closed')
+            if len(self._queue) >= self.max_queue:
+                if self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self.blocked += 1
+                    self._condition.wait_for(self._has_room)
+            self._queue.append((callback, args))
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._condition.notify_all()
+        self._wake()
+
+    def _wake(self):
+        """Tell the consumer a callback is queued."""
+
+    def _has_room(self):
+        return len(self._queue) < self.max_queue or self._closed
+
+    def _pop(self):
+        # return the next callback, None if the queue is empty
+        with self._condition:
+            if not self._queue:
+                return None
+            item = self._queue.popleft()
+            self._condition.notify_all()
+            return item
+
+    def _run(self, callback, args):
+        try:
+            return callback(*args)
+        except Exception as e:
+            logger.error('callback %s failed: %s', callback, e)
+        finally:
+            with self._condition:
+                self.processed += 1
+
+    def stats(self):
+        """Return the dispatch counters, depth is the current queue size."""
+        with self._condition:
+            return {
+                'depth': len(self._queue),
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'blocked': self.blocked
+            }
+
+
+class ThreadDispatcher(QueueDispatcher):
+    """
+    ThreadDispatcher class.
+
+    The callbacks are run by a pool of worker threads, they are run in
+    order with a single worker
+    """
+
+    def __init__(self, workers=1, max_queue=1000, policy=DROP_OLDEST):
+        """Start the workers."""
+        super().__init__(max_queue, policy)
+        self._workers = [threading.Thread(target=self._work, daemon=True,
+                                          name='irbt-dispatch-%d' % index)
+                         for index in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+            item = self._pop()
+            if item:
+                self._run(*item)
+
+    def close(self, wait=True):
+        """Stop the workers once the queued callbacks are run."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+class AsyncioDispatcher(QueueDispatcher):
+    """
+    AsyncioDispatcher class.
+
+    The callbacks are run in an asyncio event loop, coroutine
+    functions are scheduled as tasks of the loop
+    """
+
+    def __init__(self, loop, max_queue=1000, policy=DROP_OLDEST):
+        """Set the event loop."""
+        super().__init__(max_queue, policy)
+        self._loop = loop
+        self._scheduled = False
+
+    def _wake(self):
+        with self._condition:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        with self._condition:
+            self._scheduled = False
+        while True:
+            item = self._pop()
+            if item is None:
+                return
+            result = self._run(*item)
+            if asyncio.iscoroutine(result):
+                self._loop.create_task(result)
+
+    def close(self):
+        """Refuse new callbacks, the queued ones are still run."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
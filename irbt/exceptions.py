@@ -0,0 +1,33 @@
+"""
+Exceptions raised by the library.
+
+They carry the http status and the endpoint of the failed call
+"""
+
+
+class CloudAPIGetError(Exception):
+    """
+    CloudAPIGetError class.
+
+    Raised when the cloud api answers with an unexpected status
+    """
+
+    def __init__(self, status, endpoint):
+        """Store the status and the endpoint."""
+        super().__init__('CloudAPIGetError<{}>'.format(status))
+        self.status = status
+        self.endpoint = endpoint
+
+
+class CircuitOpenError(CloudAPIGetError):
+    """
+    CircuitOpenError class.
+
+    Raised without any request while the circuit of an endpoint is open
+    """
+
+    def __init__(self, endpoint, retry_in):
+        """Store the endpoint and the time before the next attempt."""
+        super().__init__(None, endpoint)
+        self.args = ('CircuitOpenError<{}>'.format(endpoint),)
+        self.retry_in = retry_in
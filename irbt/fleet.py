@@ -0,0 +1,122 @@
+"""
+Fleet class.
+
+Send the same command to many robots at once
+"""
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .logger import logging
+from .robot import COMMAND_TIMEOUT, Robot
+
+logger = logging.getLogger(__name__)
+
+DispatchResult = namedtuple('DispatchResult', 'acks errors')
+
+# robots connected at once by connect_all
+MAX_CONNECT_WORKERS = 16
+
+
+class Fleet:
+    """
+    Fleet class.
+
+    A set of robots of a cloud. The robots share the mqtt connections
+    of the cloud and stay connected between the commands until close
+    """
+
+    def __init__(self, cloud, robot_ids=None, dispatcher=None):
+        """
+        Set the robots of the fleet.
+
+        All the robots of the account when robot_ids is None, the
+        callbacks of the robots are run by dispatcher
+        """
+        self._cloud = cloud
+        self.dispatcher = dispatcher
+        if robot_ids is None:
+            robot_ids = list(cloud.robots())
+        self.robot_ids = list(robot_ids)
+        self._robots = {}
+        self._lock = threading.Lock()
+
+    def robot(self, robot_id):
+        """Return the (connected) robot of an id."""
+        with self._lock:
+            robot = self._robots.get(robot_id)
+        if robot is None:
+            robot = Robot(self._cloud, rid=robot_id,
+                          dispatcher=self.dispatcher)
+            if robot.connect() == -1:
+                raise Exception('MqttConnectError')
+            with self._lock:
+                self._robots[robot_id] = robot
+        return robot
+
+    def connect_all(self, robot_ids=None):
+        """
+        Connect the robots not connected yet, concurrently.
+
+        Return the exceptions of the robots that could not connect, by
+        robot id
+        """
+        robot_ids = self.robot_ids if robot_ids is None else robot_ids
+        with self._lock:
+            missing = [robot_id for robot_id in dict.fromkeys(robot_ids)
+                       if robot_id not in self._robots]
+        errors = {}
+        if not missing:
+            return errors
+        workers = min(len(missing), MAX_CONNECT_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {robot_id: executor.submit(self.robot, robot_id)
+                       for robot_id in missing}
+        for robot_id, future in futures.items():
+            if future.exception():
+                logger.error('connecting %s failed: %s', robot_id,
+                             future.exception())
+                errors[robot_id] = future.exception()
+        return errors
+
+    def send(self, cmd, robot_ids=None, room_ids=None,
+             timeout=COMMAND_TIMEOUT):
+        """
+        Send a command to the robots and wait for their acknowledgements.
+
+        The robots not connected yet are connected together, then the
+        commands are published without waiting for the broker and
+        their acknowledgements are awaited together, at most timeout
+        seconds. Return a DispatchResult, acks maps the robots to their
+        CommandAck and errors maps the others to their exception
+        """
+        robot_ids = self.robot_ids if robot_ids is None else robot_ids
+        futures = {}
+        errors = self.connect_all(robot_ids)
+        for robot_id in robot_ids:
+            if robot_id in errors:
+                continue
+            try:
+                futures[robot_id] = self.robot(robot_id).publish_command(
+                    cmd, room_ids=room_ids, timeout=timeout)
+            except Exception as e:
+                logger.error('sending %s to %s failed: %s', cmd, robot_id, e)
+                errors[robot_id] = e
+        wait(futures.values(), timeout=timeout)
+        acks = {}
+        for robot_id, future in futures.items():
+            if not future.done():
+                errors[robot_id] = TimeoutError(
+                    'Command %s not acknowledged by %s' % (cmd, robot_id))
+            elif future.exception():
+                errors[robot_id] = future.exception()
+            else:
+                acks[robot_id] = future.result()
+        return DispatchResult(acks, errors)
+
+    def close(self):
+        """Disconnect the robots."""
+        with self._lock:
+            robots, self._robots = self._robots, {}
+        for robot in robots.values():
+            robot.disconnect()
@@ -0,0 +1,55 @@
+"""
+Map index.
+
+In-memory index of the active map of a robot
+"""
+
+
+class MapIndex:
+    """
+    MapIndex class.
+
+    Built once per map version from the pmaps response, it gives
+    the regions by id and by name (case insensitive) and the map metadata
+    """
+
+    def __init__(self, maps):
+        """Index the first (active) map."""
+        entry = maps[0] if maps else {}
+        details = entry.get('active_pmapv_details', {})
+        self.pmap_id = details.get('active_pmapv', {}).get('pmap_id')
+        self.user_pmapv_id = entry.get('user_pmapv_id')
+        self.header = details.get('map_header', {})
+        self.regions = details.get('regions', [])
+        self.regions_by_id = {str(region['id']): region
+                              for region in self.regions}
+        self.regions_by_name = {region['name'].casefold(): region
+                                for region in self.regions
+                                if region.get('name')}
+
+    @staticmethod
+    def version_of(maps):
+        """Return the (pmap_id, user_pmapv_id) of a pmaps response."""
+        if not maps:
+            return (None, None)
+        details = maps[0].get('active_pmapv_details', {})
+        return (details.get('active_pmapv', {}).get('pmap_id'),
+                maps[0].get('user_pmapv_id'))
+
+    @property
+    def version(self):
+        """Return the (pmap_id, user_pmapv_id) of the indexed map."""
+        return (self.pmap_id, self.user_pmapv_id)
+
+    @property
+    def name(self):
+        """Return the map name."""
+        return self.header.get('name')
+
+    def region(self, room_id):
+        """Return the region of an id, or None."""
+        return self.regions_by_id.get(str(room_id))
+
+    def region_by_name(self, name):
+        """Return the region of a name (case insensitive), or None."""
+        return self.regions_by_name.get(name.casefold())
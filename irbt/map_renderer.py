@@ -1,13 +1,26 @@
 """
-Render iRobot map data as a PNG image.
+Render iRobot map data as a PNG or SVG image.
 
 Takes the JSON output from vector_map() and produces a floor plan image
-with colored rooms, walls, doors, and keepout zones.
+with colored rooms, walls, doors, and keepout zones, or a pyramid of
+tiles of it (MapTiles).
 """
 
+import io
+import itertools
 import logging
+import math
+import os
+import threading
+from array import array
+from xml.sax.saxutils import escape
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +44,76 @@ DOOR_COLOR = (230, 160, 50)
 KEEPOUT_COLOR = (220, 80, 80, 100)
 BACKGROUND_COLOR = (255, 255, 255)
 COVERAGE_COLOR = (180, 230, 180)
+TILE_SIZE = 256
+MAX_ZOOM = 6
+# coverage squares written at once in the SVG path
+SVG_CHUNK_SIZE = 500
+
 
+class PointTable:
+    """Contiguous table of metric (x, y) coordinates.
 
-def _build_point_lookup(points2d):
-    """Build a dict mapping point ID (str) to (x, y) tuple."""
-    return {str(p['id']): tuple(p['coordinates']) for p in points2d}
+    The coordinates are held in a (n, 2) NumPy array when NumPy is
+    installed, in an interleaved array('d') otherwise. The bounds and
+    the pixel transform are computed over the whole table at once.
+    """
+
+    def __init__(self, coords, ids=None):
+        """Store coords, ids are the optional point IDs (str) of the rows."""
+        self.ids = ids
+        self.coords = array('d', itertools.chain.from_iterable(coords))
+        if numpy is not None:
+            self.coords = numpy.frombuffer(self.coords).reshape(-1, 2)
+
+    @classmethod
+    def from_points2d(cls, points2d):
+        """Build the table of the points2d of a map."""
+        return cls([p['coordinates'] for p in points2d],
+                   [str(p['id']) for p in points2d])
+
+    def __len__(self):
+        """Return the number of points."""
+        if numpy is not None:
+            return len(self.coords)
+        return len(self.coords) // 2
+
+    def bounds(self):
+        """Return (x_min, y_min, x_max, y_max), None for an empty table."""
+        if not len(self):
+            return None
+        if numpy is not None:
+            (x_min, y_min), (x_max, y_max) = (self.coords.min(axis=0),
+                                              self.coords.max(axis=0))
+            return float(x_min), float(y_min), float(x_max), float(y_max)
+        xs, ys = self.coords[0::2], self.coords[1::2]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def pixel_columns(self, scale, x_min, y_min, margin, img_height):
+        """Return the pixel columns (pxs, pys), NumPy arrays or lists."""
+        if numpy is not None:
+            pixels = (self.coords - (x_min, y_min)) * scale + margin
+            return (pixels[:, 0].astype(int),
+                    (img_height - pixels[:, 1]).astype(int))
+        pxs = [int((x - x_min) * scale + margin) for x in self.coords[0::2]]
+        pys = [int(img_height - ((y - y_min) * scale + margin))
+               for y in self.coords[1::2]]
+        return pxs, pys
+
+    def _pixels(self, scale, x_min, y_min, margin, img_height):
+        pxs, pys = self.pixel_columns(scale, x_min, y_min, margin,
+                                      img_height)
+        if numpy is not None:
+            return zip(pxs.tolist(), pys.tolist())
+        return zip(pxs, pys)
+
+    def transform(self, scale, x_min, y_min, margin, img_height):
+        """Convert all the points to pixel (px, py) tuples, flipping Y."""
+        return list(self._pixels(scale, x_min, y_min, margin, img_height))
+
+    def pixel_lookup(self, scale, x_min, y_min, margin, img_height):
+        """Build a dict mapping point ID (str) to its pixel (px, py)."""
+        return dict(zip(self.ids, self._pixels(scale, x_min, y_min, margin,
+                                               img_height)))
 
 
 def _resolve_polygon_ids(id_rings, point_lookup):
@@ -48,8 +126,9 @@ def _resolve_polygon_ids(id_rings, point_lookup):
     for ring in id_rings:
         coords = []
         for pid in ring:
-            if str(pid) in point_lookup:
-                coords.append(point_lookup[str(pid)])
+            coord = point_lookup.get(str(pid))
+            if coord is not None:
+                coords.append(coord)
             else:
                 logger.warning('Point ID %s not found in points2d', pid)
         if coords:
@@ -61,25 +140,24 @@ def _resolve_linestring_ids(ids, point_lookup):
     """Convert a list of point IDs to a list of (x, y) tuples."""
     coords = []
     for pid in ids:
-        if str(pid) in point_lookup:
-            coords.append(point_lookup[str(pid)])
+        coord = point_lookup.get(str(pid))
+        if coord is not None:
+            coords.append(coord)
         else:
             logger.warning('Point ID %s not found in points2d', pid)
     return coords
 
 
-def _compute_transform(all_coords, width, margin=60):
+def _compute_transform(bounds, width, margin=60):
     """Compute scale and offset to map metric coords to pixels.
 
+    bounds is (x_min, y_min, x_max, y_max).
     Returns (scale, offset_x, offset_y, img_width, img_height).
     """
-    if not all_coords:
+    if not bounds:
         raise ValueError('No coordinates to compute transform')
 
-    xs = [c[0] for c in all_coords]
-    ys = [c[1] for c in all_coords]
-    x_min, x_max = min(xs), max(xs)
-    y_min, y_max = min(ys), max(ys)
+    x_min, y_min, x_max, y_max = bounds
 
     x_range = x_max - x_min
     y_range = y_max - y_min
@@ -102,8 +180,69 @@ def _transform_point(coord, scale, x_min, y_min, margin, img_height):
 
 def _transform_coords(coords, scale, x_min, y_min, margin, img_height):
     """Transform a list of metric coords to pixel coords."""
-    return [_transform_point(c, scale, x_min, y_min, margin, img_height)
-            for c in coords]
+    return PointTable(coords).transform(scale, x_min, y_min, margin,
+                                        img_height)
+
+
+def _dilate(mask, radius):
+    """Dilate an L mask by a square of radius pixels.
+
+    Each direction is covered by shifted copies whose offsets double,
+    so only about 4 * log2(radius) composites are made.
+    """
+    for direction in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+        reach = 0
+        while reach < radius:
+            step = min(reach + 1, radius - reach)
+            shifted = Image.new('L', mask.size, 0)
+            shifted.paste(mask, (direction[0] * step, direction[1] * step))
+            mask = ImageChops.lighter(mask, shifted)
+            reach += step
+    return mask
+
+
+def _coverage_mask(columns, size, point_size, origin=(0, 0)):
+    """Rasterize the coverage pixels as an L mask of size.
+
+    columns are the (pxs, pys) pixels of the points, origin is the
+    pixel at the top left corner of the mask. The points are binned in
+    an occupancy grid (padded by point_size so the squares of the
+    points out of the mask are kept) which is dilated to squares of
+    2 * point_size + 1 pixels.
+    """
+    pxs, pys = columns
+    dx, dy = point_size - origin[0], point_size - origin[1]
+    width, height = size[0] + 2 * point_size, size[1] + 2 * point_size
+    if numpy is not None:
+        pxs, pys = pxs + dx, pys + dy
+        inside = (pxs >= 0) & (pxs < width) & (pys >= 0) & (pys < height)
+        grid = numpy.zeros((height, width), dtype=numpy.uint8)
+        grid[pys[inside], pxs[inside]] = 255
+        mask = Image.fromarray(grid)
+    else:
+        grid = bytearray(width * height)
+        for px, py in zip(pxs, pys):
+            px, py = px + dx, py + dy
+            if 0 <= px < width and 0 <= py < height:
+                grid[py * width + px] = 255
+        mask = Image.frombytes('L', (width, height), bytes(grid))
+    mask = _dilate(mask, point_size)
+    return mask.crop((point_size, point_size, point_size + size[0],
+                      point_size + size[1]))
+
+
+def _bbox(points):
+    """Compute the (x_min, y_min, x_max, y_max) of pixel points."""
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _intersects(bbox, box, pad=0):
+    """Tell if a bbox, enlarged by pad pixels, intersects box."""
+    x_overlap = bbox[0] - pad <= box[2] and bbox[2] + pad >= box[0]
+    y_overlap = bbox[1] - pad <= box[3] and bbox[3] + pad >= box[1]
+    return x_overlap and y_overlap
 
 
 def _polygon_centroid(points):
@@ -137,110 +276,153 @@ def _get_font(size=14):
                 return ImageFont.load_default()
 
 
-def _collect_all_coords(map_entry, point_lookup):
-    """Collect all coordinates from the map for bounding box computation."""
-    all_coords = list(point_lookup.values())
+def _collect_bounds(map_entry, points):
+    """Compute the bounding box of the points and the layer coordinates.
 
+    Returns (x_min, y_min, x_max, y_max), None without coordinates.
+    """
+    tables = [points]
     for layer in map_entry.get('layers', []):
         geom = layer.get('geometry', {})
         if 'coordinates' in geom:
             coords = geom['coordinates']
             if coords and isinstance(coords[0], list):
                 if isinstance(coords[0][0], (int, float)):
-                    all_coords.extend([tuple(c) for c in coords])
+                    tables.append(PointTable(coords))
 
-    return all_coords
+    all_bounds = [table.bounds() for table in tables if len(table)]
+    if not all_bounds:
+        return None
+    return (min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+            max(b[2] for b in all_bounds), max(b[3] for b in all_bounds))
 
 
-def render_map(map_data, output_path='map.png', width=1600,
-               show_coverage=False):
-    """Render an iRobot map as a PNG image.
+def _prepare(map_data, width):
+    """Compute the transform of a map rendered width pixels wide.
 
-    Args:
-        map_data: The full JSON dict from vector_map() or loaded
-                  from examplemap.json.
-        output_path: Path to save the PNG file.
-        width: Target image width in pixels.
-        show_coverage: Whether to show the coverage layer.
+    Returns (map_entry, t_args, (img_width, img_height), point_lookup),
+    point_lookup maps the point IDs to their pixels.
     """
     maps = map_data.get('maps', [])
     if not maps:
         raise ValueError('No maps found in map data')
 
     map_entry = maps[0]
-    point_lookup = _build_point_lookup(map_entry.get('points2d', []))
-    all_coords = _collect_all_coords(map_entry, point_lookup)
+    points = PointTable.from_points2d(map_entry.get('points2d', []))
+    bounds = _collect_bounds(map_entry, points)
 
-    if not all_coords:
+    if not bounds:
         raise ValueError('No coordinates found in map data')
 
-    scale, x_min, y_min, img_w, img_h = _compute_transform(
-        all_coords, width)
+    scale, x_min, y_min, img_w, img_h = _compute_transform(bounds, width)
     t_args = (scale, x_min, y_min, 60, img_h)
+    # every point is transformed once, the shapes look up their pixels
+    return map_entry, t_args, (img_w, img_h), points.pixel_lookup(*t_args)
 
-    img = Image.new('RGBA', (img_w, img_h), BACKGROUND_COLOR + (255,))
-    draw = ImageDraw.Draw(img)
 
-    # 1. Draw coverage layer
-    if show_coverage:
-        for layer in map_entry.get('layers', []):
-            if layer.get('layer_type') == 'coverage':
-                geom = layer.get('geometry', {})
-                coords = geom.get('coordinates', [])
-                point_size = max(2, int(0.105 * scale / 2))
-                for coord in coords:
-                    px, py = _transform_point(coord, *t_args)
-                    draw.rectangle(
-                        [px - point_size, py - point_size,
-                         px + point_size, py + point_size],
-                        fill=COVERAGE_COLOR + (255,))
+def _coverage_columns(map_entry, t_args):
+    """Return the pixel columns of the coverage layers."""
+    columns = []
+    for layer in map_entry.get('layers', []):
+        if layer.get('layer_type') == 'coverage':
+            coords = layer.get('geometry', {}).get('coordinates', [])
+            if coords:
+                columns.append(PointTable(coords).pixel_columns(*t_args))
+    return columns
 
-    # 2. Draw borders
-    for border in map_entry.get('borders', []):
-        geom = border.get('geometry', {})
-        ids = geom.get('ids', [])
-        rings = _resolve_polygon_ids(ids, point_lookup)
-        free_type = border.get('free_type', 'free')
 
-        for ring in rings:
-            pixel_ring = _transform_coords(ring, *t_args)
-            if len(pixel_ring) >= 3:
-                if free_type == 'free':
-                    draw.polygon(pixel_ring, fill=FLOOR_COLOR + (255,),
-                                 outline=WALL_COLOR + (255,), width=2)
-                else:
-                    draw.polygon(pixel_ring, fill=WALL_COLOR + (255,),
-                                 outline=WALL_COLOR + (255,), width=2)
+def _map_geometry(map_entry, point_lookup):
+    """Resolve the shapes of a map to pixels.
 
-    # 3. Draw rooms as semi-transparent overlays
-    room_overlay = Image.new('RGBA', (img_w, img_h), (0, 0, 0, 0))
-    room_draw = ImageDraw.Draw(room_overlay)
+    Returns a dict mapping each layer (borders, regions, doors and
+    keepoutzones) to a list of (pixels, bbox, style) tuples.
+    """
+    geometry = {'borders': [], 'regions': [], 'doors': [],
+                'keepoutzones': []}
+
+    for border in map_entry.get('borders', []):
+        ids = border.get('geometry', {}).get('ids', [])
+        free_type = border.get('free_type', 'free')
+        for ring in _resolve_polygon_ids(ids, point_lookup):
+            if len(ring) >= 3:
+                geometry['borders'].append((ring, _bbox(ring), free_type))
 
-    room_labels = []
     for region in map_entry.get('regions', []):
-        geom = region.get('geometry', {})
-        ids = geom.get('ids', [])
-        region_type = region.get('region_type', 'custom')
-        name = region.get('name', '')
-        color = _get_room_color(region_type)
+        ids = region.get('geometry', {}).get('ids', [])
+        rings = _resolve_polygon_ids(ids, point_lookup)
+        if rings and len(rings[0]) >= 3:
+            style = (_get_room_color(region.get('region_type', 'custom')),
+                     region.get('name', ''), _polygon_centroid(rings[0]))
+            geometry['regions'].append((rings[0], _bbox(rings[0]), style))
+
+    for door in map_entry.get('doors', []):
+        ids = door.get('geometry', {}).get('ids', [])
+        coords = _resolve_linestring_ids(ids, point_lookup)
+        if len(coords) >= 2:
+            geometry['doors'].append((coords, _bbox(coords), None))
 
+    for kz in map_entry.get('keepoutzones', []):
+        ids = kz.get('geometry', {}).get('ids', [])
         rings = _resolve_polygon_ids(ids, point_lookup)
-        if rings:
-            outer_ring = rings[0]
-            pixel_ring = _transform_coords(outer_ring, *t_args)
-            if len(pixel_ring) >= 3:
-                room_draw.polygon(pixel_ring,
-                                  fill=color + (100,),
-                                  outline=color, width=2)
-                centroid = _polygon_centroid(pixel_ring)
-                room_labels.append((name, centroid))
+        if rings and len(rings[0]) >= 3:
+            geometry['keepoutzones'].append((rings[0], _bbox(rings[0]),
+                                             None))
+    return geometry
+
+
+def _draw_map(geometry, title, scale, size, coverage=None, origin=(0, 0)):
+    """Draw the map geometry on an RGBA image of size.
+
+    origin is the pixel of the whole map at the top left corner of the
+    image, the shapes out of the image are skipped. coverage is the
+    list of the pixel columns of the coverage layers, if shown.
+    """
+    ox, oy = origin
+    box = (ox, oy, ox + size[0] - 1, oy + size[1] - 1)
+
+    def visible(layer, pad):
+        for pixels, bbox, style in geometry[layer]:
+            if _intersects(bbox, box, pad):
+                if origin != (0, 0):
+                    pixels = [(x - ox, y - oy) for x, y in pixels]
+                yield pixels, style
+
+    img = Image.new('RGBA', size, BACKGROUND_COLOR + (255,))
+    draw = ImageDraw.Draw(img)
+
+    # 1. Draw coverage layer
+    if coverage:
+        point_size = max(2, int(0.105 * scale / 2))
+        for columns in coverage:
+            # one paste instead of a rectangle per point
+            mask = _coverage_mask(columns, size, point_size, origin)
+            mask_box = mask.getbbox()
+            if mask_box:
+                img.paste(COVERAGE_COLOR + (255,), mask_box,
+                          mask.crop(mask_box))
+
+    # 2. Draw borders
+    for pixel_ring, free_type in visible('borders', 2):
+        if free_type == 'free':
+            draw.polygon(pixel_ring, fill=FLOOR_COLOR + (255,),
+                         outline=WALL_COLOR + (255,), width=2)
+        else:
+            draw.polygon(pixel_ring, fill=WALL_COLOR + (255,),
+                         outline=WALL_COLOR + (255,), width=2)
+
+    # 3. Draw rooms as semi-transparent overlays
+    room_overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    room_draw = ImageDraw.Draw(room_overlay)
+    for pixel_ring, (color, _, _) in visible('regions', 2):
+        room_draw.polygon(pixel_ring, fill=color + (100,), outline=color,
+                          width=2)
 
     img = Image.alpha_composite(img, room_overlay)
     draw = ImageDraw.Draw(img)
 
     # 4. Draw room labels with text shadow for readability
     font = _get_font(22)
-    for name, (cx, cy) in room_labels:
+    for _, _, (_, name, (cx, cy)) in geometry['regions']:
         if not name:
             continue
         bbox = draw.textbbox((0, 0), name, font=font)
@@ -248,6 +430,11 @@ def render_map(map_data, output_path='map.png', width=1600,
         th = bbox[3] - bbox[1]
         tx = cx - tw // 2
         ty = cy - th // 2
+        # the drawn glyphs (descenders included) plus the 1 pixel shadow
+        drawn = (tx + bbox[0], ty + bbox[1], tx + bbox[2], ty + bbox[3])
+        if not _intersects(drawn, box, 1):
+            continue
+        tx, ty = tx - ox, ty - oy
 
         # Draw white outline/shadow for contrast
         for dx in (-1, 0, 1):
@@ -258,39 +445,231 @@ def render_map(map_data, output_path='map.png', width=1600,
         draw.text((tx, ty), name, fill=(60, 60, 60, 255), font=font)
 
     # 5. Draw doors
-    for door in map_entry.get('doors', []):
-        geom = door.get('geometry', {})
-        ids = geom.get('ids', [])
-        coords = _resolve_linestring_ids(ids, point_lookup)
-        if len(coords) >= 2:
-            pixel_coords = _transform_coords(coords, *t_args)
-            draw.line(pixel_coords, fill=DOOR_COLOR + (255,), width=4)
+    for pixel_coords, _ in visible('doors', 3):
+        draw.line(pixel_coords, fill=DOOR_COLOR + (255,), width=4)
 
     # 6. Draw keepout zones
-    keepout_overlay = Image.new('RGBA', (img_w, img_h), (0, 0, 0, 0))
+    keepout_overlay = Image.new('RGBA', size, (0, 0, 0, 0))
     keepout_draw = ImageDraw.Draw(keepout_overlay)
-    for kz in map_entry.get('keepoutzones', []):
-        geom = kz.get('geometry', {})
-        ids = geom.get('ids', [])
-        rings = _resolve_polygon_ids(ids, point_lookup)
-        if rings:
-            outer_ring = rings[0]
-            pixel_ring = _transform_coords(outer_ring, *t_args)
-            if len(pixel_ring) >= 3:
-                keepout_draw.polygon(pixel_ring,
-                                     fill=KEEPOUT_COLOR,
-                                     outline=(220, 80, 80, 200), width=2)
+    for pixel_ring, _ in visible('keepoutzones', 2):
+        keepout_draw.polygon(pixel_ring, fill=KEEPOUT_COLOR,
+                             outline=(220, 80, 80, 200), width=2)
     img = Image.alpha_composite(img, keepout_overlay)
 
     # 7. Draw map title
-    header = map_entry.get('map_header', {})
-    map_name = header.get('name', '')
-    if map_name:
+    if title:
         draw = ImageDraw.Draw(img)
         title_font = _get_font(22)
-        draw.text((15, 10), map_name, fill=(40, 40, 40, 255),
+        draw.text((15 - ox, 10 - oy), title, fill=(40, 40, 40, 255),
                   font=title_font)
+    return img
+
+
+def _svg_color(color):
+    """Convert an RGB tuple to an SVG color."""
+    return '#%02x%02x%02x' % tuple(color[:3])
+
+
+def _svg_points(pixels):
+    """Format pixels as the points attribute of an SVG polygon."""
+    return ' '.join('%d,%d' % point for point in pixels)
+
+
+def _svg_elements(geometry, title, scale, size, coverage=None):
+    """Yield the SVG document of the map geometry, element by element."""
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+           'viewBox="0 0 %d %d">\n' % (size + size))
+    yield '<rect width="100%%" height="100%%" fill="%s"/>\n' % _svg_color(
+        BACKGROUND_COLOR)
+
+    # 1. Coverage layer, one path of squares by layer
+    if coverage:
+        point_size = max(2, int(0.105 * scale / 2))
+        side = 2 * point_size + 1
+        for pxs, pys in coverage:
+            yield '<path fill="%s" d="' % _svg_color(COVERAGE_COLOR)
+            if numpy is not None:
+                pxs, pys = pxs.tolist(), pys.tolist()
+            squares = ('M%d %dh%dv%dh-%dz' % (px - point_size,
+                                              py - point_size, side, side,
+                                              side)
+                       for px, py in zip(pxs, pys))
+            chunk = ''.join(itertools.islice(squares, SVG_CHUNK_SIZE))
+            while chunk:
+                yield chunk
+                chunk = ''.join(itertools.islice(squares, SVG_CHUNK_SIZE))
+            yield '"/>\n'
+
+    # 2. Borders
+    for pixel_ring, _, free_type in geometry['borders']:
+        fill = FLOOR_COLOR if free_type == 'free' else WALL_COLOR
+        yield ('<polygon points="%s" fill="%s" stroke="%s" '
+               'stroke-width="2"/>\n' % (
+                   _svg_points(pixel_ring), _svg_color(fill),
+                   _svg_color(WALL_COLOR)))
+
+    # 3. Rooms, semi-transparent
+    for pixel_ring, _, (color, _, _) in geometry['regions']:
+        yield ('<polygon points="%s" fill="%s" fill-opacity="%.3f" '
+               'stroke="%s" stroke-width="2"/>\n' % (
+                   _svg_points(pixel_ring), _svg_color(color), 100 / 255,
+                   _svg_color(color)))
+
+    # 4. Room labels, white outline for readability
+    for _, _, (_, name, (cx, cy)) in geometry['regions']:
+        if name:
+            yield ('<text x="%d" y="%d" font-family="Arial, Helvetica, '
+                   'DejaVu Sans, sans-serif" font-size="22" '
+                   'text-anchor="middle" dominant-baseline="central" '
+                   'fill="#3c3c3c" stroke="#ffffff" stroke-width="2" '
+                   'paint-order="stroke">%s</text>\n' % (
+                       cx, cy, escape(name)))
+
+    # 5. Doors
+    for pixel_coords, _, _ in geometry['doors']:
+        yield ('<polyline points="%s" fill="none" stroke="%s" '
+               'stroke-width="4"/>\n' % (
+                   _svg_points(pixel_coords), _svg_color(DOOR_COLOR)))
+
+    # 6. Keepout zones
+    for pixel_ring, _, _ in geometry['keepoutzones']:
+        yield ('<polygon points="%s" fill="%s" fill-opacity="%.3f" '
+               'stroke="#dc5050" stroke-opacity="%.3f" '
+               'stroke-width="2"/>\n' % (
+                   _svg_points(pixel_ring), _svg_color(KEEPOUT_COLOR),
+                   KEEPOUT_COLOR[3] / 255, 200 / 255))
+
+    # 7. Map title
+    if title:
+        yield ('<text x="15" y="10" font-family="Arial, Helvetica, '
+               'DejaVu Sans, sans-serif" font-size="22" '
+               'dominant-baseline="hanging" fill="#282828">%s</text>\n'
+               % escape(title))
+    yield '</svg>\n'
+
+
+def _write_svg(elements, output):
+    """Write the SVG elements to a path or a (text or binary) file."""
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as fh:
+            _write_svg(elements, fh)
+        return
+    text = isinstance(output, io.TextIOBase)
+    for element in elements:
+        output.write(element if text else element.encode('utf-8'))
 
-    img.save(output_path, 'PNG')
-    logger.info('Map saved to %s', output_path)
+
+def render_map(map_data, output_path='map.png', width=1600,
+               show_coverage=False, image_format='png'):
+    """Render an iRobot map as a PNG or SVG image.
+
+    Args:
+        map_data: The full JSON dict from vector_map() or loaded
+                  from examplemap.json.
+        output_path: Path (or file object) to save the image.
+        width: Target image width in pixels.
+        show_coverage: Whether to show the coverage layer.
+        image_format: png, or svg to write the vector document
+                      element by element.
+    """
+    if image_format not in ('png', 'svg'):
+        raise ValueError('Unknown image format %s' % image_format)
+    map_entry, t_args, size, point_lookup = _prepare(map_data, width)
+    coverage = _coverage_columns(map_entry, t_args) if show_coverage else None
+    geometry = _map_geometry(map_entry, point_lookup)
+    title = map_entry.get('map_header', {}).get('name', '')
+
+    if image_format == 'svg':
+        _write_svg(_svg_elements(geometry, title, t_args[0], size,
+                                 coverage), output_path)
+    else:
+        img = _draw_map(geometry, title, t_args[0], size, coverage)
+        img.save(output_path, 'PNG')
+    if isinstance(output_path, (str, os.PathLike)):
+        logger.info('Map saved to %s', output_path)
     return output_path
+
+
+class MapTiles:
+    """Render a map as a z/x/y pyramid of PNG tiles.
+
+    At zoom z the map is tile_size * 2 ** z pixels wide and cut in
+    tile_size squares, x from the left and y from the top. The tiles
+    are drawn on demand with the geometry intersecting them, each zoom
+    level is transformed once. When a RenderCache is given with the
+    map id and version, the tiles are kept in it.
+    """
+
+    def __init__(self, map_data, tile_size=TILE_SIZE, max_zoom=MAX_ZOOM,
+                 show_coverage=False, cache=None, map_id=None,
+                 version=None):
+        """Set the map and the tiling.
+
+        map_data is the vector map or a function returning it, called
+        when the first tile is drawn.
+        """
+        self._map_data = map_data
+        self.tile_size = tile_size
+        self.max_zoom = max_zoom
+        self.show_coverage = show_coverage
+        self._cache = cache if None not in (map_id, version) else None
+        self._cache_key = ('tile', str(map_id), str(version), tile_size,
+                           bool(show_coverage))
+        self._levels = {}
+        self._lock = threading.Lock()
+
+    def _level(self, z):
+        if not 0 <= z <= self.max_zoom:
+            raise ValueError('Zoom %d out of 0..%d' % (z, self.max_zoom))
+        with self._lock:
+            level = self._levels.get(z)
+            if level is None:
+                if callable(self._map_data):
+                    self._map_data = self._map_data()
+                map_entry, t_args, size, point_lookup = _prepare(
+                    self._map_data, self.tile_size * 2 ** z)
+                coverage = None
+                if self.show_coverage:
+                    coverage = _coverage_columns(map_entry, t_args)
+                level = {
+                    'geometry': _map_geometry(map_entry, point_lookup),
+                    'title': map_entry.get('map_header', {}).get('name', ''),
+                    'scale': t_args[0],
+                    'size': size,
+                    'coverage': coverage
+                }
+                self._levels[z] = level
+            return level
+
+    def grid(self, z):
+        """Return the number of tiles (columns, rows) of a zoom level."""
+        width, height = self._level(z)['size']
+        return (math.ceil(width / self.tile_size),
+                math.ceil(height / self.tile_size))
+
+    def tile(self, z, x, y):
+        """Return the PNG bytes of a tile."""
+        if not 0 <= z <= self.max_zoom:
+            raise ValueError('Zoom %d out of 0..%d' % (z, self.max_zoom))
+        # the level is 2 ** z tiles wide, its height needs the map, a
+        # cached tile had its row checked when it was drawn
+        if not (0 <= x < 2 ** z and y >= 0):
+            raise ValueError('No tile %d/%d/%d' % (z, x, y))
+        key = self._cache_key + (z, x, y)
+        if self._cache is not None:
+            data = self._cache.get(key)
+            if data is not None:
+                return data
+        if y >= self.grid(z)[1]:
+            raise ValueError('No tile %d/%d/%d' % (z, x, y))
+        level = self._level(z)
+        img = _draw_map(level['geometry'], level['title'], level['scale'],
+                        (self.tile_size, self.tile_size), level['coverage'],
+                        origin=(x * self.tile_size, y * self.tile_size))
+        output = io.BytesIO()
+        img.save(output, 'PNG')
+        data = output.getvalue()
+        if self._cache is not None:
+            self._cache.put(key, data)
+        return data
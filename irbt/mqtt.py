@@ -0,0 +1,298 @@
+"""
+Mqtt connection manager.
+
+Share the websocket mqtt sessions of a cloud between its robots
+"""
+import functools
+import os
+import site
+import sysconfig
+import threading
+from os import path
+
+from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTShadowClient
+
+from .logger import logging
+
+logger = logging.getLogger(__name__)
+
+CA_CERTIFICATE = 'usr/local/etc/aws-root-ca1.cer'
+# number of robots sharing a mqtt connection
+ROBOTS_PER_CONNECTION = 50
+
+
+def ca_certificate_path():
+    """Return the path of the aws root certificate installed with irbt."""
+    setup_path = '/' + CA_CERTIFICATE
+    if path.exists(setup_path):
+        return setup_path
+    user_path = path.join(site.USER_SITE, CA_CERTIFICATE)
+    if path.exists(user_path):
+        return user_path
+    return path.join(sysconfig.get_path('purelib'), CA_CERTIFICATE)
+
+
+class MqttConnection:
+    """
+    MqttConnection class.
+
+    A shadow client connected with the cloud credentials and the
+    shadow handlers of the robots it serves, with the delta callbacks
+    of their subscribers
+    """
+
+    def __init__(self, cloud):
+        """Configure the shadow client, the connection is opened later."""
+        self.shadow_client = AWSIoTMQTTShadowClient(
+            cloud.app_id + str(os.urandom(6)), useWebsocket=True)
+        self.shadow_client.configureEndpoint(cloud.mqtt_endpoint, 443)
+        self.shadow_client.configureCredentials(ca_certificate_path())
+        self.shadow_client.configureIAMCredentials(*cloud.credentials())
+        self.shadow_client.configureAutoReconnectBackoffTime(1, 128, 20)
+        self.shadow_client.configureConnectDisconnectTimeout(10)
+        self.shadow_client.configureMQTTOperationTimeout(5)
+        self.connection = self.shadow_client.getMQTTConnection()
+        self.handlers = {}
+        self.refs = {}
+        # robot id: delta callbacks, replaced (not modified)
+        self.subscribers = {}
+        # handlers having the sdk delta callback
+        self.registered = set()
+        # serializes the network operations of the connection
+        self.lock = threading.Lock()
+        self.closed = False
+        # set once the first connection is made (or failed, see error)
+        self.opened = threading.Event()
+        self.error = None
+
+    def connect(self):
+        """Open the connection."""
+        if not self.shadow_client.connect(5):
+            raise Exception('AWSIoTMQTTShadowClientCouldNotConnect')
+
+    def disconnect(self):
+        """Close the connection."""
+        try:
+            self.shadow_client.disconnect()
+        except Exception as e:
+            logger.info('mqtt disconnection failed: %s', e)
+
+    def close(self):
+        """Close the connection for good."""
+        with self.lock:
+            self.closed = True
+            self.disconnect()
+        logger.info('[+] mqtt connection closed')
+
+
+class MqttConnectionManager:
+    """
+    MqttConnectionManager class.
+
+    Owned by the cloud, it keeps long lived mqtt connections and hands
+    out the shadow handlers of any number of robots, up to
+    robots_per_connection robots share a connection.
+    The robots are reference counted, a connection is closed when its
+    last robot is released. The sdk handler of a robot holds a single
+    delta callback, registered here and calling every subscriber of the
+    robot. Renewed credentials are given to every connection and the
+    reconnections are made here.
+    """
+
+    def __init__(self, cloud, robots_per_connection=ROBOTS_PER_CONNECTION):
+        """Set the cloud and the number of robots per connection."""
+        self._cloud = cloud
+        self.robots_per_connection = robots_per_connection
+        self._connections = []
+        self._lock = threading.RLock()
+
+    def _connection_of(self, robot_id):
+        for connection in self._connections:
+            if robot_id in connection.refs:
+                return connection
+        return None
+
+    def _open(self):
+        # made under the manager lock, connected by _connect outside it
+        connection = MqttConnection(self._cloud)
+        if not self._connections:
+            self._cloud.add_credentials_listener(self._update_credentials)
+        self._connections.append(connection)
+        return connection
+
+    def _connect(self, connection):
+        try:
+            with connection.lock:
+                connection.connect()
+        except Exception as e:
+            connection.error = e
+            with self._lock:
+                if connection in self._connections:
+                    connection.refs.clear()
+                    connection.handlers.clear()
+                    connection.subscribers.clear()
+                    self._detach(connection)
+            raise
+        finally:
+            connection.opened.set()
+        logger.info('[+] mqtt connection %d opened', self.connections())
+
+    def _detach(self, connection):
+        # the caller closes the connection once the lock is released
+        self._connections.remove(connection)
+        if not self._connections:
+            self._cloud.remove_credentials_listener(self._update_credentials)
+
+    def _update_credentials(self, access_key_id, secret_key, session_token):
+        # used by the next (re)connection
+        with self._lock:
+            for connection in self._connections:
+                connection.shadow_client.configureIAMCredentials(
+                    access_key_id, secret_key, session_token)
+
+    def _on_delta(self, connection, robot_id, payload, response_status,
+                  token):
+        for callback in connection.subscribers.get(robot_id, ()):
+            try:
+                callback(payload, response_status, token)
+            except Exception as e:
+                logger.error('delta callback %s failed: %s', callback, e)
+
+    def _sync_delta_callback(self, connection, robot_id, handler):
+        # (un)register the sdk callback of a handler, blocking calls
+        # made outside the manager lock
+        with connection.lock:
+            if connection.closed:
+                return
+            with self._lock:
+                wanted = connection.handlers.get(robot_id) is handler
+                wanted = wanted and bool(connection.subscribers.get(robot_id))
+            if wanted and handler not in connection.registered:
+                handler.shadowRegisterDeltaCallback(functools.partial(
+                    self._on_delta, connection, robot_id))
+                connection.registered.add(handler)
+            elif not wanted and handler in connection.registered:
+                handler.shadowUnregisterDeltaCallback()
+                connection.registered.discard(handler)
+
+    def acquire(self, robot_id, on_delta=None):
+        """
+        Return the shadow handler of a robot.
+
+        The robot is added to a connection having room for it, a new
+        connection is opened when none has, the other robots are not
+        blocked meanwhile. on_delta is called with the deltas of the
+        robot until it is released
+        """
+        opening = False
+        with self._lock:
+            connection = self._connection_of(robot_id)
+            if connection is None:
+                connection = next(
+                    (connection for connection in self._connections
+                     if len(connection.refs) < self.robots_per_connection),
+                    None)
+                if connection is None:
+                    connection = self._open()
+                    opening = True
+                connection.handlers[robot_id] = (
+                    connection.shadow_client.createShadowHandlerWithName(
+                        robot_id, True))
+                connection.refs[robot_id] = 0
+            connection.refs[robot_id] += 1
+            handler = connection.handlers[robot_id]
+            if on_delta:
+                connection.subscribers[robot_id] = (
+                    connection.subscribers.get(robot_id, ()) + (on_delta,))
+        if opening:
+            self._connect(connection)
+        else:
+            connection.opened.wait()
+            if connection.error:
+                raise connection.error
+        if on_delta:
+            self._sync_delta_callback(connection, robot_id, handler)
+        return handler
+
+    def release(self, robot_id, on_delta=None):
+        """Release a robot acquired before (with on_delta if given)."""
+        with self._lock:
+            connection = self._connection_of(robot_id)
+            if connection is None:
+                return
+            handler = connection.handlers[robot_id]
+            subscribers = connection.subscribers.get(robot_id, ())
+            if on_delta in subscribers:
+                index = subscribers.index(on_delta)
+                connection.subscribers[robot_id] = (
+                    subscribers[:index] + subscribers[index + 1:])
+            connection.refs[robot_id] -= 1
+            closing = False
+            if connection.refs[robot_id] <= 0:
+                del connection.refs[robot_id]
+                del connection.handlers[robot_id]
+                connection.subscribers.pop(robot_id, None)
+                closing = not connection.refs
+                if closing:
+                    self._detach(connection)
+        if closing:
+            connection.close()
+        else:
+            self._sync_delta_callback(connection, robot_id, handler)
+
+    def connection(self, robot_id):
+        """Return the mqtt connection of an acquired robot."""
+        with self._lock:
+            connection = self._connection_of(robot_id)
+            return connection.connection if connection else None
+
+    def shadow_client(self, robot_id):
+        """Return the shadow client of an acquired robot."""
+        with self._lock:
+            connection = self._connection_of(robot_id)
+            return connection.shadow_client if connection else None
+
+    def reconnect(self, robot_id):
+        """
+        Reconnect the connection of a robot with fresh credentials.
+
+        The subscriptions of its robots are restored by the client.
+        Only that connection waits for the reconnection, the robots of
+        the other connections are still acquired and released
+        """
+        with self._lock:
+            connection = self._connection_of(robot_id)
+        if connection is None:
+            return
+        with connection.lock:
+            if connection.closed:
+                return
+            logger.info('reconnecting mqtt (and refreshing the aws '
+                        'credentials)')
+            connection.disconnect()
+            connection.shadow_client.configureIAMCredentials(
+                *self._cloud.credentials())
+            connection.connect()
+
+    def robots(self):
+        """Return the ids of the acquired robots."""
+        with self._lock:
+            return [robot_id for connection in self._connections
+                    for robot_id in connection.refs]
+
+    def connections(self):
+        """Return the number of open connections."""
+        with self._lock:
+            return len(self._connections)
+
+    def close(self):
+        """Close every connection."""
+        with self._lock:
+            connections = list(self._connections)
+            for connection in connections:
+                connection.refs.clear()
+                connection.handlers.clear()
+                connection.subscribers.clear()
+                self._detach(connection)
+        for connection in connections:
+            connection.close()
@@ -149,6 +149,17 @@ args_dict = [
         'help': 'Output Raw Json (from server api) if possible',
         'default': None
     },
+    {
+        'flag': '-W',
+        'name': '--output-window',
+        'action': 'store',
+        'type': float,
+        'required': False,
+        'dest': 'output_window',
+        'help': 'Print the robot state at most once per window of '
+        'shadow deltas, in seconds (default: 1)',
+        'default': 1.0
+    },
     {
         'flag': '-g',
         'name': '--map-image',
@@ -157,7 +168,8 @@ args_dict = [
         'nargs': '?',
         'const': 'map.png',
         'dest': 'map_image',
-        'help': 'Render map as PNG image (default: map.png)',
+        'help': 'Render map as PNG (or SVG for a .svg path) image '
+                '(default: map.png)',
         'default': None
     },
     {
@@ -170,6 +182,30 @@ args_dict = [
         'dest': 'robot_password',
         'help': 'Provide robot password for association',
         'default': None
+    },
+    {
+        'flag': '-C',
+        'name': '--credential-cache',
+        'action': 'store',
+        'required': False,
+        'nargs': '?',
+        'const': '~/.cache/irbt/credentials.json',
+        'dest': 'credential_cache',
+        'help': 'Reuse the credentials stored in this file between runs '
+        '(default: ~/.cache/irbt/credentials.json)',
+        'default': None
+    },
+    {
+        'flag': '-G',
+        'name': '--render-cache',
+        'action': 'store',
+        'required': False,
+        'nargs': '?',
+        'const': '~/.cache/irbt/renders',
+        'dest': 'render_cache',
+        'help': 'Reuse the map images rendered in this directory while '
+        'the map version is unchanged (default: ~/.cache/irbt/renders)',
+        'default': None
     }
 ]
 
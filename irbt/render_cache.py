@@ -0,0 +1,192 @@
+"""
+Render cache.
+
+Keep the rendered map images between the renders of the same map version
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from .logger import logging
+from .map_renderer import render_map
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY = os.path.join('~', '.cache', 'irbt', 'renders')
+
+
+class RenderCache:
+    """
+    RenderCache class.
+
+    PNG images indexed by map id, map version, width and layer flags.
+    The images are kept in memory (LRU bounded by max_bytes) and, when
+    a directory is given, on disk (bounded by max_disk_bytes, the least
+    recently used files are removed first).
+    on_event is called with the event (hit, disk_hit, miss or eviction)
+    and the key, stats() returns the counters
+    """
+
+    def __init__(self, directory=None, max_bytes=32 * 1024 * 1024,
+                 max_disk_bytes=256 * 1024 * 1024, on_event=None):
+        """Set the budgets and the optional directory."""
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.on_event = on_event
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(map_id, version, width=1600, show_coverage=False):
+        """Return the cache key of a render."""
+        return (str(map_id), str(version), int(width), bool(show_coverage))
+
+    def _event(self, event, key):
+        if self.on_event:
+            try:
+                self.on_event(event, key)
+            except Exception as e:
+                logger.error('render cache hook failed: %s', e)
+
+    def _path(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.png')
+
+    def _remember(self, key, data):
+        # store in memory, return the evicted keys
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            if len(data) > self.max_bytes:
+                return evicted
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                old_key, old_data = self._entries.popitem(last=False)
+                self._bytes -= len(old_data)
+                self.evictions += 1
+                evicted.append(old_key)
+        return evicted
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning('ignoring unreadable render %s: %s', path, e)
+            return None
+
+    def _write_disk(self, key, data):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self._path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning('cannot remove render %s: %s', path, e)
+            total -= size
+
+    def get(self, key):
+        """Return the cached PNG bytes of key, None if not cached."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if data is not None:
+            self._event('hit', key)
+            return data
+        data = self._read_disk(key)
+        if data is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._event('disk_hit', key)
+            for evicted in self._remember(key, data):
+                self._event('eviction', evicted)
+            return data
+        with self._lock:
+            self.misses += 1
+        self._event('miss', key)
+        return None
+
+    def put(self, key, data):
+        """Cache the PNG bytes of key."""
+        for evicted in self._remember(key, data):
+            self._event('eviction', evicted)
+        if self.directory:
+            try:
+                self._write_disk(key, data)
+            except OSError as e:
+                logger.warning('cannot store render in %s: %s',
+                               self.directory, e)
+
+    def render(self, map_id, version, fetch, width=1600,
+               show_coverage=False):
+        """
+        Return the PNG bytes of a map version.
+
+        fetch is only called on a miss, it returns the vector map
+        (see Robot.vector_map) which is rendered and cached
+        """
+        key = self.key(map_id, version, width, show_coverage)
+        data = self.get(key)
+        if data is None:
+            output = io.BytesIO()
+            render_map(fetch(), output, width=width,
+                       show_coverage=show_coverage)
+            data = output.getvalue()
+            self.put(key, data)
+        return data
+
+    def clear(self):
+        """Drop the images kept in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.directory and os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.png'):
+                    os.remove(entry.path)
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,148 @@
+"""
+Response cache.
+
+Keep the responses of the slow changing endpoints of the cloud api
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# time to live in seconds, by endpoint (last part of the path)
+DEFAULT_TTLS = {
+    'robots': 300,
+    'pmaps': 60,
+    'umf': 3600
+}
+
+
+class CacheEntry:
+    """
+    CacheEntry class.
+
+    A cached json response and its validators
+    """
+
+    def __init__(self, value, expires_at, etag=None, last_modified=None):
+        """Store the response."""
+        self.value = value
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self):
+        """Return True while the entry can be used without request."""
+        return time.time() < self.expires_at
+
+    def validators(self):
+        """Return the headers of a conditional request."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    ResponseCache class.
+
+    Size bounded LRU of the json responses, indexed by path and params.
+    Each endpoint has its own time to live, 0 disables the cache for it.
+    Expired entries having an ETag or a Last-Modified header are
+    revalidated with a conditional request.
+    The responses are shared, they must not be modified.
+    """
+
+    def __init__(self, ttls=None, default_ttl=0, max_entries=128):
+        """Set the time to live of the endpoints and the size of the LRU."""
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(parts, params=None):
+        """Return the cache key of a request."""
+        return (tuple(str(part) for part in parts),
+                tuple(sorted((params or {}).items())))
+
+    def ttl(self, parts):
+        """Return the time to live of an endpoint."""
+        return self.ttls.get(str(parts[-1]) if parts else None,
+                             self.default_ttl)
+
+    def lookup(self, key):
+        """
+        Return the entry of key, fresh or not.
+
+        Hits and misses are counted here, a stale entry is a miss,
+        endpoints without time to live are not counted
+        """
+        if self.ttl(key[0]) <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.is_fresh():
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def store(self, key, value, headers=None):
+        """Cache a json response, if its endpoint has a time to live."""
+        ttl = self.ttl(key[0])
+        if ttl <= 0:
+            return
+        headers = headers or {}
+        entry = CacheEntry(value, time.time() + ttl,
+                           headers.get('ETag'), headers.get('Last-Modified'))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revalidated(self, key, entry):
+        """Extend the life of an entry the server reported unchanged."""
+        with self._lock:
+            entry.expires_at = time.time() + self.ttl(key[0])
+            self.revalidations += 1
+        return entry.value
+
+    def invalidate(self, *parts):
+        """
+        Drop the entries whose path starts with parts.
+
+        Everything is dropped when no part is given
+        """
+        prefix = tuple(str(part) for part in parts)
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key[0][:len(prefix)] == prefix]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop all the entries."""
+        self.invalidate()
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,118 @@
+"""
+Retry policy and circuit breaker.
+
+Used by the cloud api to survive transient errors
+"""
+import email.utils
+import random
+import threading
+import time
+
+from .exceptions import CircuitOpenError
+from .logger import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """
+    RetryPolicy class.
+
+    Exponential backoff with jitter for the retryable statuses and the
+    connection errors, a Retry-After header takes precedence
+    """
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30,
+                 jitter=True, statuses=(429, 500, 502, 503, 504)):
+        """Set the number of retries and the backoff parameters."""
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+
+    def is_retryable(self, status):
+        """Return True if status is worth another attempt."""
+        return status in self.statuses
+
+    @staticmethod
+    def parse_retry_after(value):
+        """Return the Retry-After header value in seconds, or None."""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, date.timestamp() - time.time())
+
+    def delay(self, attempt, retry_after=None):
+        """Return the number of seconds to wait before attempt + 1."""
+        retry_after = self.parse_retry_after(retry_after)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.max_backoff, self.backoff_factor * 2 ** attempt)
+        if self.jitter:
+            # full jitter
+            delay = random.uniform(0, delay)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker class.
+
+    Count the consecutive failures of each endpoint, after
+    failure_threshold of them the circuit opens and the calls fail
+    immediately for reset_timeout seconds, then a single trial call
+    is let through (another one every reset_timeout seconds) and closes
+    the circuit if it succeeds
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """Set the thresholds."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        # endpoint -> [consecutive failures, opened at, trial started at]
+        self._circuits = {}
+
+    def before(self, endpoint):
+        """Raise CircuitOpenError if endpoint must not be called."""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if not circuit or circuit[1] is None:
+                return
+            now = time.time()
+            retry_in = max(circuit[1], circuit[2] or 0) \
+                + self.reset_timeout - now
+            if retry_in > 0:
+                raise CircuitOpenError(endpoint, retry_in)
+            # half open, let this call through
+            circuit[2] = now
+
+    def success(self, endpoint):
+        """Close the circuit of endpoint."""
+        with self._lock:
+            self._circuits.pop(endpoint, None)
+
+    def failure(self, endpoint):
+        """Count a failure of endpoint, open its circuit if needed."""
+        with self._lock:
+            circuit = self._circuits.setdefault(endpoint, [0, None, None])
+            circuit[0] += 1
+            if circuit[2] or circuit[0] >= self.failure_threshold:
+                logger.error('circuit opened for %s after %d failures',
+                             endpoint, circuit[0])
+                circuit[1] = time.time()
+                circuit[2] = None
+
+    def is_open(self, endpoint):
+        """Return True while endpoint fails fast."""
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            return bool(circuit and circuit[1] is not None)
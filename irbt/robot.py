@@ -3,19 +3,111 @@ Robot class.
 
 It allows interactions with the robot cloud api
 """
+import codecs
 import functools
+import io
 import json
-import os
-import sysconfig
-from os import path
-import site
-
-from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTShadowClient
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
+from .dispatch import InlineDispatcher
 from .logger import logging
+from .map_index import MapIndex
+from .shadow import Coalescer, ShadowMirror
 
 logger = logging.getLogger(__name__)
 
+# endpoints that can be retrieved together with fetch_all
+FETCH_ENDPOINTS = ('maps', 'missions', 'evac_history', 'timeline',
+                   'vector_map')
+
+FetchResult = namedtuple('FetchResult', 'results errors')
+
+CommandAck = namedtuple('CommandAck', 'command initiator latency state')
+
+# seconds given to the robot to acknowledge a command
+COMMAND_TIMEOUT = 30
+# seconds given to the shadowGet response
+SHADOW_GET_TIMEOUT = 5
+# number of acknowledgement latencies kept by a robot
+COMMAND_LATENCY_HISTORY = 100
+
+# size of the chunks read from the streamed responses
+STREAM_CHUNK_SIZE = 16384
+
+
+class PendingAck:
+    """
+    PendingAck class.
+
+    A command published and waiting for its acknowledgement, timer
+    fails the future when the robot does not acknowledge it in time
+    """
+
+    def __init__(self, cmd, initiator, future, timer=None):
+        """Set the command and start the latency clock."""
+        self.cmd = cmd
+        self.initiator = initiator
+        self.future = future
+        self.sent_at = time.monotonic()
+        self.timer = timer
+
+
+def _iter_json_array(chunks):
+    """
+    Yield the items of a json array read from byte chunks.
+
+    Only the current item is kept in memory, a document which is not
+    an array is decoded at once and its items are yielded
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    in_array = None
+    chunks = iter(chunks)
+    done = False
+    while not done:
+        try:
+            chunk = utf8.decode(next(chunks))
+        except StopIteration:
+            chunk = utf8.decode(b'', final=True)
+            done = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        if in_array is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            in_array = stripped[0] == '['
+            pos = len(buffer) - len(stripped) + 1 if in_array else 0
+        if not in_array:
+            continue
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break
+            if not done and not isinstance(item, (dict, list, str)):
+                # a number is only complete once a delimiter follows it
+                # (1. or 1e may continue in the next chunk)
+                if end == len(buffer) or buffer[end] not in ' \t\r\n,]':
+                    break
+            pos = end
+            yield item
+    if in_array:
+        if buffer[pos:].strip():
+            raise ValueError('Truncated json array')
+        return
+    document = json.loads(buffer) if buffer.strip() else []
+    yield from (document if isinstance(document, list) else [document])
+
 
 def _output_status(payload, response_status, token):
     if not payload:
@@ -43,7 +135,66 @@ def _output_status(payload, response_status, token):
     logger.info(json.dumps(infos))
 
 
-class Robot:
+class RobotEndpoints:
+    """
+    RobotEndpoints class.
+
+    Describe the cloud api endpoints of a robot, shared by the
+    blocking and the asyncio robots
+    """
+
+    _id = None
+    _current_map_id = None
+    _current_user_pmapv_id = None
+    _map_index = None
+
+    def _maps_query(self):
+        params = {
+            'visible': 'true',
+            'activeDetails': '1'
+        }
+        return (self._id, 'pmaps'), params
+
+    def _set_current_map(self, maps):
+        if maps:
+            path = ['active_pmapv_details', 'active_pmapv', 'pmap_id']
+            self._current_map_id = maps[0][path[0]][path[1]][path[2]]
+            self._current_user_pmapv_id = maps[0]['user_pmapv_id']
+        # the index is only rebuilt when the map version changes
+        version = MapIndex.version_of(maps)
+        if self._map_index is None or self._map_index.version != version:
+            self._map_index = MapIndex(maps)
+
+    def _missions_query(self):
+        params = {
+            'filterType': 'omit_quickly_canceled_not_scheduled'
+        }
+        return (self._id, 'missionhistory'), params
+
+    def _evac_history_query(self, max_age=90):
+        params = {
+            'robotId': self._id,
+            'maxAge': max_age
+        }
+        return ('evachistory',), params
+
+    def _timeline_query(self):
+        params = {
+            'event_type': 'HKC',
+            'details_type_filter': 'all'
+        }
+        return ('robots', self._id, 'timeline'), params
+
+    def _vector_map_query(self, map_id=None, user_pmapv_id=None):
+        if not map_id:
+            map_id = self._current_map_id
+        if not user_pmapv_id:
+            user_pmapv_id = self._current_user_pmapv_id
+        return (self._id, 'pmaps', map_id, 'versions', user_pmapv_id,
+                'umf'), None
+
+
+class Robot(RobotEndpoints):
     """
     Class Robot.
 
@@ -81,16 +232,19 @@ class Robot:
             self.find = functools.partial(robot._cmd, 'find')
             self.resume = functools.partial(robot._cmd, 'resume')
 
-    def __init__(self, cloud=None, rid=None, output_raw=None):
+    def __init__(self, cloud=None, rid=None, output_raw=None,
+                 dispatcher=None, output_window=None):
         """
         Initialize the robot instance.
 
-        Check if a cloud is provided and
-        set the current map id.
+        No request is sent, the robot id (first robot if none) and the
+        current map are retrieved on first use or by prefetch().
+        The listeners and print_output callbacks are run by dispatcher,
+        in the mqtt thread when None (see irbt.dispatch).
+        With an output_window (seconds), print_output gets the reported
+        state once per window of deltas instead of each delta
         """
         self.command = Robot.Commands(self)
-        # alias for hass
-        self.send_command = self._cmd
 
         # if no cloud connexion is passed,create one using provided credentials
         if not cloud:
@@ -98,61 +252,86 @@ class Robot:
         else:
             self._cloud = cloud
 
-        # use provided id or first robot available
-        if rid:
-            self._id = rid
-        else:
-            self._id = list(self._cloud.robots())[0]
-
+        # use provided id or first robot available (resolved lazily)
+        self._rid = rid
         self._current_map_id = None
         self._current_user_pmapv_id = None
-        self.maps()
         self.device = None
         self.output_raw = output_raw
         self.name = None
         self.shadow_client = None
+        # reported shadow, see state
+        self._mirror = ShadowMirror()
+        self._seeding = False
+        # set when the shadowGet response is received
+        self._seed_done = threading.Event()
+        self._output = None
+        self.dispatcher = dispatcher or InlineDispatcher()
+        self._output_coalescer = None
+        if output_window:
+            self._output_coalescer = Coalescer(
+                self._emit_output, output_window, self.dispatcher.submit)
+        # (listener, coalescer) pairs, see subscribe, replaced (not
+        # modified) under _listeners_lock
+        self._listeners = []
+        self._listeners_lock = threading.Lock()
+        # commands waiting for their acknowledgement, see send_command
+        self._pending_acks = []
+        self._acks_lock = threading.Lock()
+        self.command_latencies = deque(maxlen=COMMAND_LATENCY_HISTORY)
+
+    @property
+    def _id(self):
+        if not self._rid:
+            self._rid = list(self._cloud.robots())[0]
+        return self._rid
+
+    @_id.setter
+    def _id(self, rid):
+        self._rid = rid
+
+    def prefetch(self):
+        """
+        Retrieve the robot id and the current map now.
+
+        Return the robot, for callers that want the requests up front
+        """
+        robot_id = self._id
+        logger.debug('prefetching robot %s', robot_id)
+        self.maps()
+        return self
 
     def connect(self):
         """
-        Instantiate mqtt clients and delete them when exiting.
-
-        We use AWSIoTMQTTShadowClient to create our MQTT connection.
-        This manager will close the connection on exit
-        """
-        self.shadow_client = AWSIoTMQTTShadowClient(
-            self._cloud.app_id + str(os.urandom(6)),
-            useWebsocket=True)
-        self.shadow_client.configureEndpoint(self._cloud.mqtt_endpoint, 443)
-        setuppath='/usr/local/etc/aws-root-ca1.cer'
-        pippath=site.USER_SITE if path.exists("%s/usr/local/etc/aws-root-ca1.cer" % site.USER_SITE) else sysconfig.get_path('purelib')
-        cerpath=setuppath if path.exists(setuppath) else "%s/usr/local/etc/aws-root-ca1.cer" % pippath
-        self.shadow_client.configureCredentials(cerpath)
-        self.shadow_client.configureIAMCredentials(
-            self._cloud.access_key_id,
-            self._cloud.secret_key,
-            self._cloud.session_token)
-        self.shadow_client.configureAutoReconnectBackoffTime(1, 128, 20)
-        self.shadow_client.configureConnectDisconnectTimeout(10)
-        self.shadow_client.configureMQTTOperationTimeout(5)
-        # Set keepAlive interval to be 1 second and connect
-        # Raise exception if there is an error in connecting to AWS IoT
+        Get the shadow handler of the robot.
 
+        The mqtt connection is shared with the other robots of the cloud
+        and kept open by its connection manager until disconnect.
+        The state mirror is seeded and follows the deltas from now on
+        """
         try:
-            if not self.shadow_client.connect(5):
-                raise Exception('AWSIoTMQTTShadowClientCouldNotConnect')
+            if self.device is None:
+                self.device = self._cloud.mqtt.acquire(self._id,
+                                                       self._on_delta)
         except ValueError as e:
             logger.error("shadow_client.connect returned '%s'"
                          ', credentials are not authorized.', str(e))
             return -1
-        self.device = self.shadow_client.createShadowHandlerWithName(self._id,
-                                                                     True)
-        self.connection = self.shadow_client.getMQTTConnection()
+        self.shadow_client = self._cloud.mqtt.shadow_client(self._id)
+        self.connection = self._cloud.mqtt.connection(self._id)
         logger.info('[+] mqtt connected')
+        self._watch()
 
     def disconnect(self):
-        """Disconnect the mqtt stuff."""
+        """Release the mqtt connection, once."""
+        if self.device is None:
+            return
+        if self._output_coalescer:
+            self._output_coalescer.flush()
         logger.info('[+] mqtt disconnected')
-        self.connection.disconnect()
+        self._cloud.mqtt.release(self._id, self._on_delta)
+        self.device = None
+        self._seeding = False
 
     # return maps and set active one
     def maps(self):
@@ -162,16 +341,9 @@ class Robot:
         Used to return a map lists and to set the active one in the instance
         only retrieve first map for now (fixme)
         """
-        maps=[]
-        params = {
-            'visible': 'true',
-            'activeDetails': '1'
-        }
-        maps = self._cloud.api.get(self._id, 'pmaps', params=params)
-        if maps:
-            path = ['active_pmapv_details', 'active_pmapv', 'pmap_id']
-            self._current_map_id = maps[0][path[0]][path[1]][path[2]]
-            self._current_user_pmapv_id = maps[0]['user_pmapv_id']
+        parts, params = self._maps_query()
+        maps = self._cloud.api.get(*parts, params=params)
+        self._set_current_map(maps)
         return maps
 
     def rooms(self):
@@ -180,10 +352,8 @@ class Robot:
 
         Retrieve a correctly formated room list for humans
         """
-        if self.maps():
-            return (self.maps()[0]['active_pmapv_details']['regions'])
-        else:
-            return []
+        self.maps()
+        return self._map_index.regions
 
     def missions(self):
         """
@@ -191,24 +361,38 @@ class Robot:
 
         return a json with the list of the finished missions and their statuses
         """
-        params = {
-            'filterType': 'omit_quickly_canceled_not_scheduled'
-        }
-        return self._cloud.api.get(self._id,
-                                   'missionhistory',
-                                   params=params)
+        parts, params = self._missions_query()
+        return self._cloud.api.get(*parts, params=params)
+
+    def iter_missions(self, limit=None):
+        """
+        Iterate over the achieved missions, most recent first.
 
-    def evac_history(self):
+        The response is streamed and decoded one mission at a time,
+        stopping after limit missions closes the connection without
+        downloading the rest of the history
+        """
+        parts, params = self._missions_query()
+        response = self._cloud.api.get(*parts, params=params, as_json=False,
+                                       stream=True)
+        try:
+            missions = _iter_json_array(
+                response.iter_content(STREAM_CHUNK_SIZE))
+            for count, mission in enumerate(missions, 1):
+                yield mission
+                if limit is not None and count >= limit:
+                    break
+        finally:
+            response.close()
+
+    def evac_history(self, max_age=90):
         """
         Return logs of evacuations.
 
-        return a json with logs of evacuations
+        return a json with logs of evacuations of the last max_age days
         """
-        params = {
-            'robotId': self._id,
-            'maxAge': 90
-        }
-        return self._cloud.api.get('evachistory', params=params)
+        parts, params = self._evac_history_query(max_age)
+        return self._cloud.api.get(*parts, params=params)
 
     def timeline(self):
         """
@@ -216,14 +400,8 @@ class Robot:
 
         return a json with the event timeline
         """
-        params = {
-            'event_type': 'HKC',
-            'details_type_filter': 'all'
-        }
-        return self._cloud.api.get('robots',
-                                   self._id,
-                                   'timeline',
-                                   params=params)
+        parts, params = self._timeline_query()
+        return self._cloud.api.get(*parts, params=params)
 
     def vector_map(self, map_id=None, user_pmapv_id=None):
         """
@@ -232,16 +410,80 @@ class Robot:
         Return a json with coordinates of the map
         and history of the mission if any.
         """
-        if not map_id:
-            map_id = self._current_map_id
-        if not user_pmapv_id:
-            user_pmapv_id = self._current_user_pmapv_id
-        return self._cloud.api.get(self._id,
-                                   'pmaps',
-                                   map_id,
-                                   'versions',
-                                   user_pmapv_id,
-                                   'umf')
+        if not map_id or not user_pmapv_id:
+            self.map_index()
+        parts, params = self._vector_map_query(map_id, user_pmapv_id)
+        return self._cloud.api.get(*parts, params=params)
+
+    def map_image(self, width=1600, show_coverage=False, cache=None):
+        """
+        Return the current map rendered as PNG bytes.
+
+        With a RenderCache, the vector map is only retrieved and drawn
+        when its version (user_pmapv_id) is not cached yet
+        """
+        # imported here, the rest of the robot works without Pillow
+        from .map_renderer import render_map
+        self.maps()
+        index = self._map_index
+        if cache is not None:
+            return cache.render(index.pmap_id, index.user_pmapv_id,
+                                self.vector_map, width=width,
+                                show_coverage=show_coverage)
+        output = io.BytesIO()
+        render_map(self.vector_map(), output, width=width,
+                   show_coverage=show_coverage)
+        return output.getvalue()
+
+    def map_tiles(self, tile_size=256, show_coverage=False, cache=None):
+        """
+        Return the tiles of the current map (a MapTiles).
+
+        The vector map is retrieved when the first tile missing from
+        cache (a RenderCache) is drawn
+        """
+        # imported here, the rest of the robot works without Pillow
+        from .map_renderer import MapTiles
+        self.maps()
+        index = self._map_index
+        return MapTiles(self.vector_map, tile_size=tile_size,
+                        show_coverage=show_coverage, cache=cache,
+                        map_id=index.pmap_id, version=index.user_pmapv_id)
+
+    def fetch_all(self, endpoints=FETCH_ENDPOINTS, max_workers=5):
+        """
+        Retrieve several endpoints in parallel.
+
+        Return a FetchResult, results maps each endpoint name to its
+        response and errors maps the endpoints that failed to their
+        exception
+        """
+        for endpoint in endpoints:
+            if endpoint not in FETCH_ENDPOINTS:
+                raise ValueError('Unknown endpoint %s' % endpoint)
+        results = {}
+        errors = {}
+        # the lazy robot id is resolved once, before the workers
+        robot_id = self._id
+        logger.debug('fetching %s of robot %s', ', '.join(endpoints),
+                     robot_id)
+        # vector_map waits for the current map retrieved by maps
+        deferred = 'maps' in endpoints and self._map_index is None
+        deferred = deferred and 'vector_map' in endpoints
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {endpoint: executor.submit(getattr(self, endpoint))
+                       for endpoint in endpoints
+                       if not (deferred and endpoint == 'vector_map')}
+            if deferred:
+                wait([futures['maps']])
+                futures['vector_map'] = executor.submit(self.vector_map)
+            for endpoint, future in futures.items():
+                try:
+                    results[endpoint] = future.result()
+                except Exception as e:
+                    logger.error('fetching %s failed: %s', endpoint, e)
+                    errors[endpoint] = e
+        return FetchResult(results, errors)
 
     def _make_payload(self, room_ids, cmd):
         payload = {
@@ -251,57 +493,246 @@ class Robot:
             'ordered': 0,
         }
         if cmd == 'start' and room_ids:
+            index = self.map_index()
             logger.info('start cleaning of :')
             for room_id in room_ids.split(','):
-                logger.info('  - %s (%s)', self.get_room_name(room_id),
+                region = index.region(room_id)
+                logger.info('  - %s (%s)', region and region['name'],
                             room_id)
             regions = [{'type':'rid', 'region_id': room_id}
                        for room_id in room_ids.split(',')] \
                 if ',' in room_ids else [{'region_id': room_ids, 'type': 'rid'}]
             payload.update({
-                'pmap_id': self._current_map_id,
+                'pmap_id': index.pmap_id,
                 'regions': regions,
-                'user_pmapv_id': self._current_user_pmapv_id
+                'user_pmapv_id': index.user_pmapv_id
             })
         return payload
 
+    def _on_shadow_get(self, payload, response_status, token):
+        self._seeding = False
+        if response_status == 'accepted':
+            self._mirror.seed(payload)
+            # the deltas kept for the seed may hold a lastCommand
+            self._check_acks()
+        self._seed_done.set()
+        if self._output:
+            self.dispatcher.submit(self._output, payload, response_status,
+                                   token)
+
+    def _on_delta(self, payload, response_status, token):
+        # the delta callback of the robot, the payload is decoded once
+        delta = json.loads(payload) if payload else {}
+        before = self._mirror.state().document
+        changes = self._mirror.apply(delta)
+        if changes is None:
+            return
+        if 'lastCommand' in changes:
+            self._check_acks()
+        document = self._mirror.state().document
+        for listener, coalescer in self._listeners:
+            if coalescer:
+                coalescer.add(before, delta, document)
+            else:
+                self.dispatcher.submit(listener, delta, document)
+        if self._output_coalescer and self._output:
+            self._output_coalescer.add(before, delta, document)
+        elif self._output:
+            self.dispatcher.submit(self._output, payload, response_status,
+                                   token)
+
+    def _emit_output(self, delta, document):
+        # the coalesced deltas of a window, printed as the whole state
+        if self._output:
+            self._output(json.dumps({'state': {'reported': document},
+                                     'version': delta.get('version')}),
+                         'delta', None)
+
+    def subscribe(self, listener, window=None):
+        """
+        Call listener on each shadow delta of the robot.
+
+        It receives the decoded delta and the updated reported state
+        (which must not be modified), through the dispatcher. A listener
+        is only registered once, the robot has a single sdk callback.
+        With a window (seconds), the deltas received during the window
+        are coalesced: the listener gets one delta holding the fields
+        that changed over it
+        """
+        with self._listeners_lock:
+            if any(registered == listener
+                   for registered, _ in self._listeners):
+                return
+            coalescer = None
+            if window:
+                coalescer = Coalescer(listener, window,
+                                      self.dispatcher.submit)
+            self._listeners = self._listeners + [(listener, coalescer)]
+
+    def unsubscribe(self, listener):
+        """Stop calling a listener, its coalesced changes are dropped."""
+        with self._listeners_lock:
+            for registered, coalescer in self._listeners:
+                if registered == listener and coalescer:
+                    coalescer.cancel()
+            self._listeners = [(registered, coalescer)
+                               for registered, coalescer in self._listeners
+                               if registered != listener]
+
+    def _watch(self):
+        # one shadowGet and the deltas (see connect) feed the mirror
+        if self._mirror.is_seeded() or self._seeding:
+            return
+        self._seeding = True
+        self._seed_done.clear()
+        try:
+            self.device.shadowGet(self._on_shadow_get, SHADOW_GET_TIMEOUT)
+        except Exception as e:
+            logger.info('shadow get failed, exception: %s', e)
+            self._cloud.mqtt.reconnect(self._id)
+            try:
+                self.device.shadowGet(self._on_shadow_get,
+                                      SHADOW_GET_TIMEOUT)
+            except Exception:
+                self._seeding = False
+                self._seed_done.set()
+                raise
+
+    def _show_state(self, print_output):
+        self._output = print_output
+        if self._mirror.is_seeded():
+            if print_output:
+                self.dispatcher.submit(print_output, self._mirror.payload(),
+                                       'mirror', None)
+            return
+        # printed by _on_shadow_get, waited for as the caller may
+        # disconnect right away
+        self._watch()
+        if not self._seed_done.wait(SHADOW_GET_TIMEOUT):
+            logger.warning('no shadow state received from %s', self._id)
+
+    def _command_topic(self):
+        return '%s/things/%s/cmd' % (self._cloud.mqtt_topic, self._id)
+
     def _cmd(self, cmd, room_ids=None, print_output=_output_status):
-        topic = '%s/things/%s/cmd' % (self._cloud.mqtt_topic, self._id)
+        topic = self._command_topic()
         qos = 1
 
         payload = self._make_payload(room_ids, cmd)
 
         if cmd == 'status':
-            try:
-                self.device.shadowGet(print_output, 5)
-            except Exception as e:
-                logger.info('shadow get failed, exception: %s', e)
-                logger.info('trying to refresh the connection (and the aws \
-                             credentials)')
-                self.disconnect()
-                self.connect()
-                self.device.shadowGet(print_output, 5)
-
-            self.device.shadowRegisterDeltaCallback(print_output)
+            self._show_state(print_output)
             return 0  # exit(0)
         logger.info(
             'executing command %s on robot %s, payload : %s',
             cmd, self._id, payload)
 
         if self.connection.publish(topic, json.dumps(payload), qos):
-            try:
-                self.device.shadowGet(print_output, 5)
-            except Exception as e:
-                logger.info('shadow get failed, exception: %s', e)
-                logger.info('trying to refresh the connection (and the aws \
-                             credentials)')
-                self.disconnect()
-                self.connect()
-                self.device.shadowGet(print_output, 5)
-            self.device.shadowRegisterDeltaCallback(print_output)
+            self._show_state(print_output)
         else:
             raise Exception('MqttPublish%sError' % cmd)
 
+    def send_command(self, cmd, room_ids=None, print_output=_output_status,
+                     timeout=COMMAND_TIMEOUT):
+        """
+        Send a command and return a future of its acknowledgement.
+
+        The future resolves to a CommandAck when the reported lastCommand
+        matches the command and its initiator, or fails with a
+        TimeoutError after timeout seconds. The status command resolves
+        at once. Use asyncio.wrap_future to await it.
+        The latencies between publication and acknowledgement are kept
+        in command_latencies
+        """
+        if cmd == 'status':
+            future = Future()
+            self._cmd(cmd, room_ids, print_output)
+            future.set_result(CommandAck(cmd, None, 0.0,
+                                         self.state.document))
+            return future
+        return self._track_ack(cmd, timeout, functools.partial(
+            self._cmd, cmd, room_ids, print_output))
+
+    def publish_command(self, cmd, room_ids=None, timeout=COMMAND_TIMEOUT):
+        """
+        Publish a command without waiting for the broker.
+
+        Return the future of its acknowledgement, as send_command, but
+        nothing is printed. The robot must be connected
+        """
+        self._watch()
+        return self._track_ack(cmd, timeout, functools.partial(
+            self._publish_async, cmd, room_ids))
+
+    def _publish_async(self, cmd, room_ids):
+        payload = self._make_payload(room_ids, cmd)
+        logger.info('publishing command %s on robot %s, payload : %s',
+                    cmd, self._id, payload)
+        self.connection.publishAsync(self._command_topic(),
+                                     json.dumps(payload), 1)
+
+    def _track_ack(self, cmd, timeout, publish):
+        future = Future()
+        initiator = self._make_payload(None, cmd)['initiator']
+        pending = PendingAck(cmd, initiator, future)
+        pending.timer = threading.Timer(timeout, self._expire_ack, [pending])
+        pending.timer.daemon = True
+        # registered first, the acknowledgement can precede the publish
+        with self._acks_lock:
+            self._pending_acks.append(pending)
+        try:
+            publish()
+        except Exception as e:
+            self._drop_ack(pending)
+            future.set_exception(e)
+            return future
+        if not future.done():
+            pending.timer.start()
+        return future
+
+    def _drop_ack(self, pending):
+        with self._acks_lock:
+            if pending not in self._pending_acks:
+                return False
+            self._pending_acks.remove(pending)
+        return True
+
+    def _expire_ack(self, pending):
+        if self._drop_ack(pending):
+            pending.future.set_exception(TimeoutError(
+                'Command %s not acknowledged by %s' % (pending.cmd,
+                                                       self._id)))
+
+    def _check_acks(self):
+        document = self._mirror.state().document or {}
+        last_command = document.get('lastCommand') or {}
+        acked = (last_command.get('command'), last_command.get('initiator'))
+        with self._acks_lock:
+            done = [pending for pending in self._pending_acks
+                    if (pending.cmd, pending.initiator) == acked]
+            for pending in done:
+                self._pending_acks.remove(pending)
+        for pending in done:
+            if pending.timer:
+                pending.timer.cancel()
+            latency = time.monotonic() - pending.sent_at
+            self.command_latencies.append(latency)
+            logger.debug('command %s acknowledged by %s in %.3fs',
+                         pending.cmd, self._id, latency)
+            pending.future.set_result(CommandAck(
+                pending.cmd, pending.initiator, latency, document))
+
+    @property
+    def state(self):
+        """
+        Return the last known reported state and its age.
+
+        The document is the local mirror of the shadow, it is returned
+        without any request (None until the robot is connected) and
+        must not be modified
+        """
+        return self._mirror.state()
+
     def current_state(self, state):
         """Return state as expected by the hass module."""
         # https://github.com/NickWaterton/Roomba980-Python/blob/master/roomba/roomba.py
@@ -331,14 +762,20 @@ class Robot:
                 logger.info('%s == %s' % (key, value))
         logger.info('-- End of Received keys --')
 
+    def map_index(self):
+        """Return the index of the current map, retrieved if needed."""
+        if self._map_index is None:
+            self.maps()
+        return self._map_index
+
     def get_room_id(self, name):
-        """Get room id from name."""
-        for room in self.rooms():
-            if name == room['name']:
-                return room['id']
+        """Get room id from name (case insensitive)."""
+        room = self.map_index().region_by_name(name)
+        if room:
+            return room['id']
 
     def get_room_name(self, room_id):
         """Get room name from id."""
-        for room in self.rooms():
-            if room_id == room['id']:
-                return room['name']
+        room = self.map_index().region(room_id)
+        if room:
+            return room['name']
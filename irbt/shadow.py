@@ -0,0 +1,200 @@
+"""
+Shadow mirror.
+
+Keep a local copy of the reported shadow of a robot
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+
+from .logger import logging
+
+logger = logging.getLogger(__name__)
+
+ShadowState = namedtuple('ShadowState', 'document age')
+
+
+def merge(document, changes):
+    """
+    Return document updated with changes.
+
+    Nested objects are merged and null values remove their key, as the
+    shadow service does. document is not modified, the unchanged parts
+    are shared with the result
+    """
+    merged = dict(document)
+    for key, value in changes.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def diff(before, after):
+    """
+    Return the changes turning before into after.
+
+    Only the fields that differ are kept, removed keys are null
+    """
+    changes = {}
+    for key, value in after.items():
+        old = before.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = diff(old, value)
+            if nested:
+                changes[key] = nested
+        elif key not in before or old != value:
+            changes[key] = value
+    for key in before:
+        if key not in after:
+            changes[key] = None
+    return changes
+
+
+class Coalescer:
+    """
+    Coalescer class.
+
+    Gather the deltas received during window seconds (from the first
+    one) and give the listener a single delta holding the fields that
+    changed over the window
+    """
+
+    def __init__(self, listener, window, submit):
+        """Set the listener, the window and the function running it."""
+        self.listener = listener
+        self.window = window
+        self._submit = submit
+        self._before = None
+        self._document = None
+        self._version = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, before, delta, document):
+        """Add a delta, before and document are the states around it."""
+        with self._lock:
+            if self._timer is None:
+                self._before = before or {}
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            self._document = document
+            self._version = delta.get('version', self._version)
+
+    def flush(self):
+        """Give the changes gathered so far to the listener."""
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+            self._timer = None
+            before, document = self._before, self._document
+        changes = diff(before, document)
+        if changes:
+            self._submit(self.listener, {'state': changes,
+                                         'version': self._version},
+                         document)
+
+    def cancel(self):
+        """Drop the changes gathered so far."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+class ShadowMirror:
+    """
+    ShadowMirror class.
+
+    The reported state of a robot, seeded by a shadowGet and kept up to
+    date with the deltas. The deltas received before the seed are kept
+    and merged in it. The document is replaced on each update and
+    never modified in place, readers get it without lock or request
+    and must not modify it
+    """
+
+    def __init__(self):
+        """Start empty."""
+        self.document = None
+        self.version = None
+        self.updated_at = None
+        self._buffered = []
+        self._lock = threading.Lock()
+
+    def is_seeded(self):
+        """Return True once a full document was received."""
+        return self.document is not None
+
+    @staticmethod
+    def _decode(payload):
+        if isinstance(payload, (str, bytes)):
+            payload = json.loads(payload) if payload else None
+        return payload or {}
+
+    def _is_outdated(self, version):
+        return None not in (version, self.version) and version < self.version
+
+    def seed(self, payload):
+        """Replace the document by the one of a shadowGet response."""
+        payload = self._decode(payload)
+        reported = payload.get('state', {}).get('reported')
+        if reported is None:
+            return
+        with self._lock:
+            if self._is_outdated(payload.get('version')):
+                return
+            self.document = reported
+            self.version = payload.get('version')
+            for version, changes in self._buffered:
+                if self._is_outdated(version):
+                    continue
+                self.document = merge(self.document, changes)
+                if version is not None:
+                    self.version = version
+            self._buffered = []
+            self.updated_at = time.monotonic()
+
+    def apply(self, payload):
+        """
+        Merge a delta (or an update document) in the document.
+
+        Return the changes merged, None when the version is outdated or
+        the mirror is not seeded yet (the delta is kept for the seed)
+        """
+        payload = self._decode(payload)
+        state = payload.get('state')
+        if not state:
+            return None
+        changes = state.get('reported', state)
+        with self._lock:
+            if self._is_outdated(payload.get('version')):
+                logger.debug('ignoring shadow version %s',
+                             payload.get('version'))
+                return None
+            if self.document is None:
+                self._buffered.append((payload.get('version'), changes))
+                return None
+            self.document = merge(self.document or {}, changes)
+            if payload.get('version') is not None:
+                self.version = payload['version']
+            self.updated_at = time.monotonic()
+        return changes
+
+    def state(self):
+        """Return the document and its age in seconds (None if unknown)."""
+        with self._lock:
+            document, updated_at = self.document, self.updated_at
+        if updated_at is None:
+            return ShadowState(None, None)
+        return ShadowState(document, time.monotonic() - updated_at)
+
+    def payload(self):
+        """Return the document as a shadowGet response payload."""
+        return json.dumps({'state': {'reported': self.document},
+                           'version': self.version})
@@ -0,0 +1,134 @@
+"""
+Aws signature version 4 signer.
+
+Sign the api gateway requests, the derived signing keys are cached
+"""
+import hashlib
+import hmac
+import time
+from urllib.parse import quote, urlparse
+
+import requests
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+EMPTY_PAYLOAD_HASH = hashlib.sha256(b'').hexdigest()
+
+
+def _sign(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def signing_key(secret_key, datestamp, region, service):
+    """
+    Return the signing key of a day.
+
+    The derivation chain (date, region, service, aws4_request) only
+    depends on its arguments
+    """
+    key = _sign(('AWS4' + secret_key).encode('utf-8'), datestamp)
+    key = _sign(key, region)
+    key = _sign(key, service)
+    return _sign(key, 'aws4_request')
+
+
+def canonical_querystring(query):
+    """Return the sorted query string, its values are already encoded."""
+    params = []
+    for param in sorted(query.split('&')):
+        key, _, value = param.partition('=')
+        if key:
+            params.append(key + '=' + value)
+    return '&'.join(params)
+
+
+class SigV4Auth(requests.auth.AuthBase):
+    """
+    SigV4Auth class.
+
+    Requests auth adding the signature version 4 headers, everything
+    that does not depend on the request is computed once. The signing
+    key of the day is kept by the instance, it goes away with the
+    credentials
+    """
+
+    def __init__(self, access_key_id, secret_key, session_token, host,
+                 region, service='execute-api'):
+        """Precompute the request independent parts of the signature."""
+        self.access_key_id = access_key_id
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.host = host
+        self.region = region
+        self.service = service
+        self._scope_suffix = '/%s/%s/aws4_request' % (region, service)
+        self._host_header = 'host:%s\n' % host
+        self._signed_headers = 'host;x-amz-date'
+        self._token_header = ''
+        if session_token:
+            self._signed_headers += ';x-amz-security-token'
+            self._token_header = 'x-amz-security-token:%s\n' % session_token
+        self._credential = '%s Credential=%s/' % (ALGORITHM, access_key_id)
+        self._signing_keys = {}
+
+    def _signing_key(self, datestamp):
+        # derived once per day, only the key of the current day is kept
+        key = (datestamp, self.region, self.service)
+        if key not in self._signing_keys:
+            self._signing_keys = {key: signing_key(self.secret_key, *key)}
+        return self._signing_keys[key]
+
+    def sign(self, method, url, body=None, now=None):
+        """
+        Return the headers signing a request.
+
+        now is the signature time (epoch), the current time by default
+        """
+        now = time.gmtime(now)
+        amzdate = time.strftime('%Y%m%dT%H%M%SZ', now)
+        datestamp = amzdate[:8]
+
+        if body:
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            payload_hash = hashlib.sha256(body).hexdigest()
+        else:
+            payload_hash = EMPTY_PAYLOAD_HASH
+
+        parsed_url = urlparse(url)
+        canonical_headers = '%sx-amz-date:%s\n%s' % (
+            self._host_header, amzdate, self._token_header)
+        canonical_request = '\n'.join((
+            method,
+            quote(parsed_url.path or '/', safe='/-_.~'),
+            canonical_querystring(parsed_url.query),
+            canonical_headers,
+            self._signed_headers,
+            payload_hash))
+
+        credential_scope = datestamp + self._scope_suffix
+        string_to_sign = '\n'.join((
+            ALGORITHM, amzdate, credential_scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()))
+        signature = hmac.new(
+            self._signing_key(datestamp), string_to_sign.encode('utf-8'),
+            hashlib.sha256).hexdigest()
+
+        headers = {
+            'Authorization': '%s%s, SignedHeaders=%s, Signature=%s' % (
+                self._credential, credential_scope, self._signed_headers,
+                signature),
+            'x-amz-date': amzdate,
+            'x-amz-content-sha256': payload_hash
+        }
+        if self.session_token:
+            headers['X-Amz-Security-Token'] = self.session_token
+        return headers
+
+    def sign_request(self, request):
+        """Return the headers signing a prepared request."""
+        return self.sign(request.method, request.url, request.body)
+
+    def __call__(self, request):
+        """Add the signature headers to a prepared request."""
+        request.headers.update(self.sign_request(request))
+        return request
@@ -0,0 +1,263 @@
+"""
+Local sync store.
+
+Keep the missions, evacuations and timeline of the robots in sqlite
+and only retrieve the records newer than the last synchronization
+"""
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+
+from .logger import logging
+
+logger = logging.getLogger(__name__)
+
+# evachistory does not go further back (days)
+MAX_EVAC_AGE = 90
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    robot_id TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    high_water REAL NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (robot_id, stream)
+);
+CREATE TABLE IF NOT EXISTS missions (
+    robot_id TEXT NOT NULL,
+    mission_id TEXT NOT NULL,
+    start_time REAL,
+    timestamp REAL,
+    outcome TEXT,
+    initiator TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (robot_id, mission_id)
+);
+CREATE INDEX IF NOT EXISTS missions_start
+    ON missions (robot_id, start_time);
+CREATE INDEX IF NOT EXISTS missions_outcome
+    ON missions (robot_id, outcome, start_time);
+CREATE INDEX IF NOT EXISTS missions_initiator
+    ON missions (robot_id, initiator, start_time);
+CREATE TABLE IF NOT EXISTS evacuations (
+    robot_id TEXT NOT NULL,
+    evac_id TEXT NOT NULL,
+    time REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (robot_id, evac_id)
+);
+CREATE INDEX IF NOT EXISTS evacuations_time
+    ON evacuations (robot_id, time);
+CREATE TABLE IF NOT EXISTS timeline (
+    robot_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    start_time REAL,
+    created REAL,
+    event_type TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (robot_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS timeline_start
+    ON timeline (robot_id, start_time);
+"""
+
+
+def _first_of(record, keys):
+    for key in keys:
+        if record.get(key) is not None:
+            return record[key]
+    return None
+
+
+def _is_old(value, high_water):
+    return None not in (value, high_water) and value <= high_water
+
+
+def _record_id(record):
+    # records without id are identified by their content
+    return hashlib.sha1(
+        json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SyncStore:
+    """
+    SyncStore class.
+
+    Sqlite store of the robot histories, sync() only inserts the
+    records above the high-water mark of each robot and stream, the
+    queries are answered from indexed tables
+    """
+
+    def __init__(self, path=':memory:'):
+        """Open (and create if needed) the database."""
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+    def high_water(self, robot_id, stream):
+        """Return the newest timestamp synchronized for a stream."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT high_water FROM sync_state '
+                'WHERE robot_id = ? AND stream = ?',
+                (robot_id, stream)).fetchone()
+        return row['high_water'] if row else None
+
+    def _save(self, robot_id, stream, table, rows, high_water):
+        columns = ', '.join(rows[0].keys()) if rows else None
+        with self._lock, self._db:
+            if rows:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO %s (robot_id, %s) '
+                    'VALUES (?, %s)' % (table, columns,
+                                        ', '.join('?' * len(rows[0]))),
+                    [(robot_id,) + tuple(row.values()) for row in rows])
+            if high_water is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO sync_state '
+                    '(robot_id, stream, high_water, synced_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (robot_id, stream, high_water, time.time()))
+        return len(rows)
+
+    def sync(self, robot):
+        """
+        Retrieve the new records of a robot.
+
+        Return the number of records stored by stream
+        """
+        return {
+            'missions': self.sync_missions(robot),
+            'evacuations': self.sync_evacuations(robot),
+            'timeline': self.sync_timeline(robot)
+        }
+
+    def sync_missions(self, robot):
+        """
+        Store the missions finished after the high-water mark.
+
+        The history comes most recent first, the stream is closed at
+        the first mission already known
+        """
+        robot_id = robot._id
+        high_water = self.high_water(robot_id, 'missions')
+        rows = []
+        newest = high_water
+        for mission in robot.iter_missions():
+            timestamp = _first_of(mission, ('timestamp', 'startTime'))
+            if _is_old(timestamp, high_water):
+                break
+            rows.append({
+                'mission_id': str(mission.get('nMssn',
+                                              _record_id(mission))),
+                'start_time': mission.get('startTime'),
+                'timestamp': timestamp,
+                'outcome': mission.get('done'),
+                'initiator': mission.get('initiator'),
+                'data': json.dumps(mission)
+            })
+            if timestamp is not None:
+                newest = max(newest or timestamp, timestamp)
+        logger.debug('%d new missions for %s', len(rows), robot_id)
+        return self._save(robot_id, 'missions', 'missions', rows, newest)
+
+    def sync_evacuations(self, robot):
+        """
+        Store the evacuations newer than the high-water mark.
+
+        Only the days since the newest evacuation stored are requested,
+        the mark is kept when no timestamped evacuation is received
+        """
+        robot_id = robot._id
+        high_water = self.high_water(robot_id, 'evacuations')
+        max_age = MAX_EVAC_AGE
+        if high_water is not None:
+            days = math.ceil((time.time() - high_water) / 86400) + 1
+            max_age = max(1, min(MAX_EVAC_AGE, days))
+        reports = robot.evac_history(max_age=max_age).get('EvacReports', [])
+        rows = []
+        newest = high_water
+        for report in reports:
+            evac_time = _first_of(report, ('timestamp', 'ts', 'time',
+                                           'startTime'))
+            if _is_old(evac_time, high_water):
+                continue
+            rows.append({
+                'evac_id': _record_id(report),
+                'time': evac_time,
+                'data': json.dumps(report)
+            })
+            if evac_time is not None:
+                newest = max(newest or evac_time, evac_time)
+        return self._save(robot_id, 'evacuations', 'evacuations', rows,
+                          newest)
+
+    def sync_timeline(self, robot):
+        """Store the timeline events created after the high-water mark."""
+        robot_id = robot._id
+        high_water = self.high_water(robot_id, 'timeline')
+        rows = []
+        newest = high_water
+        for event in robot.timeline().get('events', []):
+            created = _first_of(event, ('hkc_created_ts', 'start_time'))
+            if _is_old(created, high_water):
+                continue
+            rows.append({
+                'event_id': event.get('event_id') or _record_id(event),
+                'start_time': event.get('start_time'),
+                'created': created,
+                'event_type': event.get('event_type'),
+                'data': json.dumps(event)
+            })
+            if created is not None:
+                newest = max(newest or created, created)
+        return self._save(robot_id, 'timeline', 'timeline', rows, newest)
+
+    def _query(self, table, time_column, robot_id, start, end, filters):
+        clauses = ['robot_id = ?']
+        args = [robot_id]
+        for column, value in filters:
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                args.append(value)
+        if start is not None:
+            clauses.append('%s >= ?' % time_column)
+            args.append(start)
+        if end is not None:
+            clauses.append('%s < ?' % time_column)
+            args.append(end)
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT data FROM %s WHERE %s ORDER BY %s DESC'
+                % (table, ' AND '.join(clauses), time_column),
+                args).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def missions(self, robot_id, start=None, end=None, outcome=None,
+                 initiator=None):
+        """
+        Return the stored missions, most recent first.
+
+        start and end bound the start time (timestamps, end excluded),
+        outcome is the done field (ok, stuck, ...)
+        """
+        return self._query('missions', 'start_time', robot_id, start, end,
+                           [('outcome', outcome), ('initiator', initiator)])
+
+    def evacuations(self, robot_id, start=None, end=None):
+        """Return the stored evacuations, most recent first."""
+        return self._query('evacuations', 'time', robot_id, start, end, [])
+
+    def timeline(self, robot_id, start=None, end=None, event_type=None):
+        """Return the stored timeline events, most recent first."""
+        return self._query('timeline', 'start_time', robot_id, start, end,
+                           [('event_type', event_type)])
@@ -21,10 +21,14 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     scripts=['bin/irbt-cli.py'],
     install_requires=[
-        'aws-requests-auth',
         'AWSIoTPythonSDK',
         'Pillow>=9.0.0',
+        'requests',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'numpy': ['numpy'],
+    },
     data_files=[('/usr/local/etc', ['config/aws-root-ca1.cer'])],
     classifiers=[
         'Programming Language :: Python :: 3',
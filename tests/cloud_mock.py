@@ -3,6 +3,7 @@ Mock cloud class.
 
 Mock cloud class
 """
+import json
 import pprint
 
 responses = {
@@ -324,6 +325,25 @@ responses = {
 }
 
 
+class ResponseMock:
+    """Streamed response mock."""
+
+    def __init__(self, value, chunk_size=7):
+        """Serialize the json value."""
+        self.content = json.dumps(value).encode('utf-8')
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        """Yield the body by small chunks."""
+        for start in range(0, len(self.content), self.chunk_size):
+            yield self.content[start:start + self.chunk_size]
+
+    def close(self):
+        """Close the response."""
+        self.closed = True
+
+
 class CloudMock:
     """
     Cloud class.
@@ -346,7 +366,7 @@ class CloudMock:
             """Initialize cloud mock."""
             self.cloud = cloud
 
-        def get(self, *a, params=None, as_json=True):
+        def get(self, *a, params=None, as_json=True, stream=False):
             """
             HTTP GET.
 
@@ -358,6 +378,8 @@ class CloudMock:
             ]
             parts.extend(a)
             pprint.pprint(parts)
+            if not as_json:
+                return ResponseMock(responses['/'.join(parts)])
             return responses['/'.join(parts)]
 
     def __init__(self, username=None, password=None):
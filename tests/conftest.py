@@ -11,6 +11,7 @@ from irbt import Robot
 import pytest
 
 from tests.cloud_mock import CloudMock
+from tests.mqtt_mock import ShadowClientMock
 
 Credential = namedtuple('Credential', 'username password')
 
@@ -37,3 +38,12 @@ def cloud(credential):
 def robot(cloud):
     """Robot instance (mock)."""
     return Robot(cloud)
+
+
+@pytest.fixture
+def shadow_clients(monkeypatch):
+    """Replace the aws shadow client by a mock, return its instances."""
+    monkeypatch.setattr('irbt.mqtt.AWSIoTMQTTShadowClient',
+                        ShadowClientMock)
+    monkeypatch.setattr(ShadowClientMock, 'instances', [])
+    return ShadowClientMock.instances
@@ -0,0 +1,146 @@
+"""
+Mqtt mock.
+
+Fake AWSIoTMQTTShadowClient recording the calls made by irbt
+"""
+import json
+
+
+class ShadowHandlerMock:
+    """
+    Shadow handler mock.
+
+    Answer shadowGet with the reported state of the client
+    """
+
+    def __init__(self, client, name):
+        """Set the thing name."""
+        self.client = client
+        self.name = name
+        self.delta_callback = None
+        self.registrations = 0
+        self.gets = 0
+        self.pending_gets = []
+
+    def shadowGet(self, callback, timeout):  # noqa: N802
+        """Call back with the reported state, later if defer_gets."""
+        self.gets += 1
+        if self.client.fail_gets:
+            self.client.fail_gets -= 1
+            raise Exception('shadowGet timeout')
+        self.pending_gets.append(callback)
+        if not self.client.defer_gets:
+            self.answer_gets()
+        return 'token'
+
+    def answer_gets(self):
+        """Call back the pending shadowGet with the reported state."""
+        callbacks, self.pending_gets = self.pending_gets, []
+        for callback in callbacks:
+            callback(json.dumps({'state': {'reported': self.client.reported},
+                                 'version': 1}), 'accepted', 'token')
+
+    def shadowRegisterDeltaCallback(self, callback):  # noqa: N802
+        """Register the delta callback, replacing the previous one."""
+        self.delta_callback = callback
+        self.registrations += 1
+
+    def shadowUnregisterDeltaCallback(self):  # noqa: N802
+        """Unregister the delta callback."""
+        self.delta_callback = None
+
+    def delta(self, state, version=2):
+        """Send a delta to the registered callback."""
+        payload = json.dumps({'state': state, 'version': version})
+        if self.delta_callback:
+            self.delta_callback(payload, 'delta/' + self.name, None)
+
+
+class ConnectionMock:
+    """
+    Mqtt connection mock.
+
+    Record the published messages
+    """
+
+    def __init__(self):
+        """Start without message."""
+        self.published = []
+        self.on_publish = None
+
+    def publish(self, topic, payload, qos):
+        """Record a message, on_publish is called with it if set."""
+        self.published.append((topic, json.loads(payload)))
+        if self.on_publish:
+            self.on_publish(topic, json.loads(payload))
+        return True
+
+    def publishAsync(self, topic, payload, qos, ackCallback=None):  # noqa
+        """Record a message and acknowledge it."""
+        self.publish(topic, payload, qos)
+        if ackCallback:
+            ackCallback(len(self.published))
+        return len(self.published)
+
+
+class ShadowClientMock:
+    """
+    AWSIoTMQTTShadowClient mock.
+
+    Every instance is kept in instances
+    """
+
+    instances = []
+
+    def __init__(self, client_id, useWebsocket=False):  # noqa: N803
+        """Record the instance."""
+        self.client_id = client_id
+        self.credentials = []
+        self.connects = 0
+        self.disconnects = 0
+        self.handlers = {}
+        self.connection = ConnectionMock()
+        self.reported = {'batPct': 100}
+        self.fail_gets = 0
+        self.defer_gets = False
+        ShadowClientMock.instances.append(self)
+
+    def configureEndpoint(self, host, port):  # noqa: N802
+        """Set the endpoint."""
+        self.endpoint = (host, port)
+
+    def configureCredentials(self, ca_path):  # noqa: N802
+        """Set the certificate."""
+        self.ca_path = ca_path
+
+    def configureIAMCredentials(self, *credentials):  # noqa: N802
+        """Record the credentials."""
+        self.credentials.append(credentials)
+
+    def configureAutoReconnectBackoffTime(self, *args):  # noqa: N802
+        """Ignore the backoff."""
+
+    def configureConnectDisconnectTimeout(self, timeout):  # noqa: N802
+        """Ignore the timeout."""
+
+    def configureMQTTOperationTimeout(self, timeout):  # noqa: N802
+        """Ignore the timeout."""
+
+    def getMQTTConnection(self):  # noqa: N802
+        """Return the connection."""
+        return self.connection
+
+    def connect(self, keep_alive):
+        """Count the connections."""
+        self.connects += 1
+        return True
+
+    def disconnect(self):
+        """Count the disconnections."""
+        self.disconnects += 1
+        return True
+
+    def createShadowHandlerWithName(self, name, persistent):  # noqa: N802
+        """Return a shadow handler."""
+        self.handlers[name] = ShadowHandlerMock(self, name)
+        return self.handlers[name]
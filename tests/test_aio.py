@@ -0,0 +1,104 @@
+"""
+Test asyncio classes.
+
+Early stage
+"""
+import asyncio
+import time
+
+import pytest
+
+from tests.cloud_mock import responses
+
+aiohttp = pytest.importorskip('aiohttp')
+test_utils = pytest.importorskip('aiohttp.test_utils')
+web = pytest.importorskip('aiohttp.web')
+
+
+def _make_app(paths=None):
+    async def handler(request):
+        path = request.path.lstrip('/')
+        if paths is not None:
+            paths.append(path)
+        if path not in responses:
+            return web.Response(status=404)
+        assert(request.headers['Authorization'].startswith(
+            'AWS4-HMAC-SHA256 Credential=AKID/'))
+        return web.json_response(responses[path])
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handler)
+    return app
+
+
+async def _cloud_and_server(paths=None):
+    from irbt import AsyncCloud
+
+    server = test_utils.TestServer(_make_app(paths))
+    await server.start_server()
+    cloud = AsyncCloud()
+    cloud._set_disc({
+        'gigya': {'api_key': 'key'},
+        'httpBaseAuth': str(server.make_url('')).rstrip('/'),
+        'httpBase': 'https://unauth.example.com',
+        'awsRegion': 'us-east-1',
+        'mqtt': 'mqtt.example.com',
+        'irbtTopics': 'v011-irbthbu'
+    })
+    cloud._set_credentials('AKID', 'SECRET', 'TOKEN', time.time() + 3600)
+    return cloud, server
+
+
+def test_async_robot():
+    """
+    Test async robot.
+
+    Endpoints are fetched concurrently on one event loop
+    """
+    from irbt import AsyncRobot
+
+    async def run():
+        cloud, server = await _cloud_and_server()
+        try:
+            robot = await AsyncRobot.create(cloud)
+            assert(robot._id == '1234ABCD1234ABCD1234ABCD1234ABCD')
+            assert(robot._current_map_id == 'en12a9_lTglkpPqazxDWED')
+            missions, evacs, timeline, vector_map, rooms = (
+                await asyncio.gather(robot.missions(), robot.evac_history(),
+                                     robot.timeline(), robot.vector_map(),
+                                     robot.rooms()))
+        finally:
+            await cloud.close()
+            await server.close()
+        assert(missions == responses[
+            'v1/1234ABCD1234ABCD1234ABCD1234ABCD/missionhistory'])
+        assert(evacs == responses['v1/evachistory'])
+        assert(timeline['events'][0]['event_type'] == 'HKC')
+        assert(vector_map == {})
+        assert(len(rooms) == 7)
+
+    asyncio.run(run())
+
+
+def test_async_robot_fetch_all():
+    """
+    Test async robot fetch_all.
+
+    On a fresh robot the robot id and the maps are retrieved once
+    """
+    from irbt import AsyncRobot
+
+    async def run():
+        paths = []
+        cloud, server = await _cloud_and_server(paths)
+        try:
+            result = await AsyncRobot(cloud).fetch_all()
+        finally:
+            await cloud.close()
+            await server.close()
+        assert(result.errors == {})
+        assert(result.results['vector_map'] == {})
+        assert(paths.count('v1/user/associations/robots') == 1)
+        assert(paths.count('v1/1234ABCD1234ABCD1234ABCD1234ABCD/pmaps') == 1)
+
+    asyncio.run(run())
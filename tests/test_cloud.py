@@ -15,3 +15,299 @@ def test_cloud(credential, Cloud):  # noqa: N803
     assert(credential.password == 'test_password')
     cloud = Cloud(credential.username, credential.password)
     assert(cloud)
+
+
+def test_cloud_session_pool():
+    """
+    Test cloud session pool.
+
+    The http adapter is shared by all the calls of a cloud instance
+    """
+    from irbt import Cloud
+
+    cloud = Cloud(pool_connections=2, pool_maxsize=4, keep_alive=False)
+    adapter = cloud.session.get_adapter('https://api.example.com')
+    assert(adapter is cloud.session.get_adapter('https://example.org'))
+    assert(adapter._pool_connections == 2)
+    assert(adapter._pool_maxsize == 4)
+    assert(cloud.session.headers['Connection'] == 'close')
+    cloud.close()
+
+
+def test_cloud_credential_cache(tmp_path):
+    """
+    Test cloud credential cache.
+
+    A valid cached entry skips the login stages
+    """
+    import os
+    import time
+
+    from irbt import Cloud, CredentialCache
+
+    disc_api = {
+        'gigya': {'api_key': 'key'},
+        'httpBaseAuth': 'https://auth.example.com',
+        'httpBase': 'https://unauth.example.com',
+        'awsRegion': 'us-east-1',
+        'mqtt': 'mqtt.example.com',
+        'irbtTopics': 'v011-irbthbu'
+    }
+    cache = CredentialCache(str(tmp_path / 'irbt' / 'credentials.json'))
+    assert(cache.load('test@example.com') is None)
+    cache.save('test@example.com', disc_api, 'AKID', 'SECRET', 'TOKEN',
+               time.time() + 3600)
+    assert(os.stat(cache.path).st_mode & 0o777 == 0o600)
+
+    cloud = Cloud('test@example.com', 'test_password',
+                  credential_cache=cache)
+    assert(cloud.access_key_id == 'AKID')
+    assert(cloud.session_token == 'TOKEN')
+    assert(cloud.service_url == 'https://auth.example.com/v1/')
+    assert(cloud.auth is not None)
+
+    cache.save('test@example.com', disc_api, 'AKID', 'SECRET', 'TOKEN',
+               time.time() + 30)
+    assert(cache.load('test@example.com') is None)
+    cache.clear('test@example.com')
+    assert(cache._read() == {})
+
+
+def test_cloud_auto_refresh():
+    """
+    Test cloud auto refresh.
+
+    Credentials are renewed in the background and listeners notified
+    """
+    import threading
+    import time
+
+    from irbt import Cloud
+
+    cloud = Cloud()
+    cloud.refresh_margin = 300
+    renewed = threading.Event()
+
+    def login(username, password, use_cache=True):
+        cloud._set_credentials('AKID2', 'SECRET2', 'TOKEN2',
+                               time.time() + 3600)
+        return True
+
+    cloud.login = login
+    cloud.add_credentials_listener(lambda *creds: renewed.set())
+    cloud._set_credentials('AKID', 'SECRET', 'TOKEN', time.time() + 10)
+    renewed.clear()
+    cloud.start_auto_refresh()
+    assert(renewed.wait(5))
+    assert(cloud.credentials() == ('AKID2', 'SECRET2', 'TOKEN2'))
+    # next renewal is scheduled before the new expiration
+    with cloud._auth_lock:
+        assert(cloud._refresh_timer is not None)
+    cloud.close()
+    assert(cloud._refresh_timer is None)
+
+
+def test_cloud_single_flight_renewal():
+    """
+    Test cloud single flight renewal.
+
+    Concurrent renewals of the same stale auth only login once
+    """
+    import threading
+    import time
+
+    from irbt import Cloud
+
+    cloud = Cloud()
+    cloud._set_credentials('AKID', 'SECRET', 'TOKEN', time.time() + 3600)
+    stale_auth = cloud.auth
+    logins = []
+
+    def login(username, password, use_cache=True):
+        with cloud._login_lock:
+            logins.append(username)
+            time.sleep(0.05)
+            cloud._set_credentials('AKID2', 'SECRET2', 'TOKEN2',
+                                   time.time() + 3600)
+            return True
+
+    cloud.login = login
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(cloud.renew_credentials(stale_auth)))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert(len(logins) == 1)
+    assert(results == [True] * 8)
+    assert(cloud.auth is not stale_auth)
+
+
+class FakeResponse:
+    """Minimal requests response."""
+
+    def __init__(self, status_code, value=None, headers=None):
+        """Store the response."""
+        self.status_code = status_code
+        self.value = value
+        self.headers = headers or {}
+        self.content = b''
+
+    def json(self):
+        """Return the json body."""
+        return self.value
+
+    def close(self):
+        """Release the connection."""
+
+
+class FakeSession:
+    """Session returning queued responses and recording the requests."""
+
+    def __init__(self, *responses):
+        """Queue the responses."""
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, auth=None, **kwargs):
+        """Return the next response."""
+        self.requests.append((url, params, headers))
+        return self.responses.pop(0)
+
+    def post(self, url, json=None, auth=None, **kwargs):
+        """Return the next response."""
+        self.requests.append((url, json, None))
+        return self.responses.pop(0)
+
+
+def _logged_cloud(**kwargs):
+    import time
+
+    from irbt import Cloud
+
+    cloud = Cloud(**kwargs)
+    cloud._set_disc({
+        'gigya': {'api_key': 'key'},
+        'httpBaseAuth': 'https://auth.example.com',
+        'httpBase': 'https://unauth.example.com',
+        'awsRegion': 'us-east-1',
+        'mqtt': 'mqtt.example.com',
+        'irbtTopics': 'v011-irbthbu'
+    })
+    cloud._set_credentials('AKID', 'SECRET', 'TOKEN', time.time() + 3600)
+    return cloud
+
+
+def test_cloud_response_cache():
+    """
+    Test cloud response cache.
+
+    Fresh entries are served locally, stale ones are revalidated
+    """
+    from irbt import ResponseCache
+
+    cache = ResponseCache(ttls={'pmaps': 60})
+    cloud = _logged_cloud(response_cache=cache)
+    cloud.session = FakeSession(
+        FakeResponse(200, [{'pmap_id': 'a'}], {'ETag': '"v1"'}),
+        FakeResponse(304),
+        FakeResponse(200, {'events': []}),
+        FakeResponse(200, {'events': []}))
+
+    params = {'visible': 'true'}
+    maps = cloud.api.get('rid', 'pmaps', params=params)
+    assert(cloud.api.get('rid', 'pmaps', params=params) is maps)
+    assert(len(cloud.session.requests) == 1)
+
+    # expire the entry, it is revalidated with its etag
+    cache._entries[cache.key(('rid', 'pmaps'), params)].expires_at = 0
+    assert(cloud.api.get('rid', 'pmaps', params=params) is maps)
+    assert(cloud.session.requests[1][2] == {'If-None-Match': '"v1"'})
+
+    # endpoints without ttl are not cached
+    cloud.api.get('robots', 'rid', 'timeline')
+    cloud.api.get('robots', 'rid', 'timeline')
+    assert(len(cloud.session.requests) == 4)
+    assert(cache.stats() == {'entries': 1, 'hits': 1, 'misses': 2,
+                             'revalidations': 1, 'evictions': 0})
+
+    cache.invalidate('rid')
+    assert(cache.stats()['entries'] == 0)
+
+    # an association drops the cached robot list
+    cache.ttls['robots'] = 60
+    cloud.session.responses = [FakeResponse(200, {'a': {}}),
+                               FakeResponse(200),
+                               FakeResponse(200, {'a': {}, 'b': {}})]
+    assert(list(cloud.robots()) == ['a'])
+    assert(list(cloud.robots()) == ['a'])
+    cloud.assoc('password', 'b')
+    assert(list(cloud.robots()) == ['a', 'b'])
+    assert(len(cloud.session.requests) == 7)
+
+
+def test_cloud_retry_and_circuit_breaker():
+    """
+    Test cloud retries and circuit breaker.
+
+    Transient errors are retried, then the circuit opens
+    """
+    import pytest
+
+    from irbt import (CircuitBreaker, CircuitOpenError, CloudAPIGetError,
+                      RetryPolicy)
+
+    cloud = _logged_cloud(
+        retry_policy=RetryPolicy(max_retries=2, backoff_factor=0),
+        circuit_breaker=CircuitBreaker(failure_threshold=2,
+                                       reset_timeout=60))
+    cloud.session = FakeSession(
+        FakeResponse(503), FakeResponse(429, headers={'Retry-After': '0'}),
+        FakeResponse(200, {'EvacReports': []}),
+        FakeResponse(502), FakeResponse(502), FakeResponse(502),
+        FakeResponse(404),
+        FakeResponse(500), FakeResponse(500), FakeResponse(500))
+
+    assert(cloud.api.get('evachistory') == {'EvacReports': []})
+    assert(len(cloud.session.requests) == 3)
+
+    with pytest.raises(CloudAPIGetError) as error:
+        cloud.api.get('evachistory')
+    assert(error.value.status == 502)
+    assert(error.value.endpoint == 'evachistory')
+    assert(str(error.value) == 'CloudAPIGetError<502>')
+
+    # client errors are not retried and reset the failure count
+    with pytest.raises(CloudAPIGetError) as error:
+        cloud.api.get('evachistory')
+    assert(error.value.status == 404)
+
+    with pytest.raises(CloudAPIGetError):
+        cloud.api.get('evachistory')
+    assert(not cloud.circuit_breaker.is_open('evachistory'))
+    cloud.session.responses = [FakeResponse(500)] * 3
+    with pytest.raises(CloudAPIGetError):
+        cloud.api.get('evachistory')
+    assert(cloud.circuit_breaker.is_open('evachistory'))
+    sent = len(cloud.session.requests)
+    with pytest.raises(CircuitOpenError):
+        cloud.api.get('evachistory')
+    assert(len(cloud.session.requests) == sent)
+
+
+def test_retry_policy_delay():
+    """
+    Test retry policy delay.
+
+    Exponential backoff capped, Retry-After wins
+    """
+    from irbt import RetryPolicy
+
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=False)
+    assert([policy.delay(attempt) for attempt in range(4)] == [1, 2, 4, 5])
+    assert(policy.delay(0, '3') == 3)
+    assert(policy.delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT') == 0)
+    jittered = RetryPolicy(backoff_factor=1).delay(2)
+    assert(0 <= jittered <= 4)
@@ -0,0 +1,108 @@
+"""
+Test callback dispatchers.
+
+Early stage
+"""
+import asyncio
+import threading
+import time
+
+from irbt.dispatch import (AsyncioDispatcher, InlineDispatcher,
+                           ThreadDispatcher)
+
+import pytest
+
+from tests.test_cloud import _logged_cloud
+
+
+def test_thread_dispatcher_drop_oldest():
+    """
+    Test thread dispatcher drop oldest.
+
+    A slow consumer does not block the producer, old events are dropped
+    """
+    release = threading.Event()
+    calls = []
+    dispatcher = ThreadDispatcher(max_queue=2)
+    dispatcher.submit(release.wait)
+    while dispatcher.stats()['depth']:
+        time.sleep(0.001)
+    for value in range(5):
+        dispatcher.submit(calls.append, value)
+    assert(dispatcher.stats()['depth'] == 2)
+    release.set()
+    dispatcher.close()
+    assert(calls == [3, 4])
+    stats = dispatcher.stats()
+    assert((stats['submitted'], stats['processed'], stats['dropped'],
+            stats['max_depth']) == (6, 3, 3, 2))
+
+
+def test_thread_dispatcher_block():
+    """
+    Test thread dispatcher block.
+
+    The producer waits for room, every event is delivered in order
+    """
+    calls = []
+    dispatcher = ThreadDispatcher(max_queue=1, policy='block')
+    for value in range(50):
+        dispatcher.submit(calls.append, value)
+    dispatcher.close()
+    assert(calls == list(range(50)))
+    assert(dispatcher.stats()['dropped'] == 0)
+    with pytest.raises(RuntimeError):
+        dispatcher.submit(calls.append, 50)
+    with pytest.raises(ValueError):
+        ThreadDispatcher(policy='drop_newest')
+
+
+def test_asyncio_dispatcher():
+    """
+    Test asyncio dispatcher.
+
+    Callbacks submitted from another thread run in the loop
+    """
+    async def run():
+        loop = asyncio.get_running_loop()
+        dispatcher = AsyncioDispatcher(loop)
+        done = asyncio.Event()
+        calls = []
+
+        async def on_event(value):
+            calls.append((value, threading.current_thread()))
+            if value == 2:
+                done.set()
+
+        thread = threading.Thread(target=lambda: [
+            dispatcher.submit(on_event, value) for value in range(3)])
+        thread.start()
+        await asyncio.wait_for(done.wait(), 1)
+        thread.join()
+        return calls
+
+    calls = asyncio.run(run())
+    assert([value for value, _ in calls] == [0, 1, 2])
+    assert({thread for _, thread in calls} == {threading.current_thread()})
+
+
+def test_robot_dispatcher(shadow_clients):
+    """
+    Test robot dispatcher.
+
+    The listeners run in the dispatcher, not in the mqtt thread
+    """
+    from irbt import Robot
+
+    assert(InlineDispatcher().stats()['depth'] == 0)
+    dispatcher = ThreadDispatcher()
+    robot = Robot(_logged_cloud(), rid='a', dispatcher=dispatcher)
+    robot.connect()
+    threads = []
+    robot.subscribe(lambda delta, document: threads.append(
+        threading.current_thread()))
+    shadow_clients[0].handlers['a'].delta({'batPct': 10})
+    dispatcher.close()
+    assert(len(threads) == 1)
+    assert(threads[0] is not threading.current_thread())
+    robot.disconnect()
@@ -0,0 +1,79 @@
+"""
+Test fleet class.
+
+Early stage
+"""
+from tests.test_cloud import _logged_cloud
+
+
+def test_fleet_send(shadow_clients):
+    """
+    Test fleet send.
+
+    Commands are published on shared connections, acks are collected
+    """
+    from irbt.fleet import Fleet
+
+    cloud = _logged_cloud(mqtt_robots_per_connection=2)
+    fleet = Fleet(cloud, ['a', 'b', 'c'])
+    for robot_id in fleet.robot_ids:
+        fleet.robot(robot_id)
+
+    def acknowledge(client):
+        def on_publish(topic, payload):
+            robot_id = topic.split('/')[2]
+            if robot_id != 'c':
+                client.handlers[robot_id].delta({'lastCommand': {
+                    'command': payload['command'],
+                    'initiator': payload['initiator']}})
+        return on_publish
+
+    for client in shadow_clients:
+        client.connection.on_publish = acknowledge(client)
+    result = fleet.send('dock', timeout=0.05)
+    assert(len(shadow_clients) == 2)
+    assert(sorted(result.acks) == ['a', 'b'])
+    assert(result.acks['a'].command == 'dock')
+    assert(list(result.errors) == ['c'])
+    assert(isinstance(result.errors['c'], TimeoutError))
+    published = [topic for client in shadow_clients
+                 for topic, _ in client.connection.published]
+    assert(sorted(published) == ['v011-irbthbu/things/%s/cmd' % rid
+                                 for rid in 'abc'])
+
+    fleet.close()
+    assert(cloud.mqtt.connections() == 0)
+
+
+def test_fleet_connect_all(shadow_clients, monkeypatch):
+    """
+    Test fleet connect_all.
+
+    The robots are connected at once, failures are reported by robot
+    """
+    import threading
+
+    from irbt import Robot
+    from irbt.fleet import Fleet
+
+    cloud = _logged_cloud()
+    barrier = threading.Barrier(3, timeout=1)
+    connect = Robot.connect
+
+    def overlapping_connect(robot):
+        # every connect waits for the others
+        barrier.wait()
+        if robot._id == 'c':
+            raise Exception('MqttConnectError')
+        return connect(robot)
+
+    monkeypatch.setattr(Robot, 'connect', overlapping_connect)
+    fleet = Fleet(cloud, ['a', 'b', 'c'])
+    errors = fleet.connect_all()
+    assert(list(errors) == ['c'])
+    assert(sorted(fleet._robots) == ['a', 'b'])
+    # a single robot connects from now on
+    barrier = threading.Barrier(1)
+    result = fleet.send('dock', robot_ids=['a', 'c'], timeout=0.01)
+    assert(str(result.errors['c']) == 'MqttConnectError')
+    fleet.close()
@@ -0,0 +1,226 @@
+"""
+Test map renderer.
+
+Early stage
+"""
+import io
+import random
+
+from irbt import map_renderer
+
+import pytest
+
+
+def _square_map():
+    points = [[0, 0], [4, 0], [4, 3], [0, 3], [1, 1], [2, 1]]
+    return {'maps': [{
+        'map_header': {'name': 'Square'},
+        'points2d': [{'id': str(pid), 'coordinates': coords}
+                     for pid, coords in enumerate(points)],
+        'borders': [{'geometry': {'ids': [['0', '1', '2', '3']]}}],
+        'regions': [{'geometry': {'ids': [['0', '1', '2', '3']]},
+                     'region_type': 'kitchen', 'name': 'Kitchen'}],
+        'doors': [{'geometry': {'ids': ['4', '5']}}],
+        'layers': [{'layer_type': 'coverage',
+                    'geometry': {'coordinates': [[1, 2], [5, 2]]}}]
+    }]}
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_point_table(monkeypatch, use_numpy):
+    """
+    Test point table.
+
+    The batched transform matches the per point one
+    """
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(map_renderer, 'numpy', None)
+    rng = random.Random(1)
+    coords = [(rng.uniform(-20, 20), rng.uniform(-20, 20))
+              for _ in range(500)]
+    table = map_renderer.PointTable(coords, [str(i) for i in range(500)])
+    assert(len(table) == 500)
+    bounds = table.bounds()
+    assert(bounds == (min(c[0] for c in coords), min(c[1] for c in coords),
+                      max(c[0] for c in coords), max(c[1] for c in coords)))
+    t_args = map_renderer._compute_transform(bounds, 800)
+    t_args = t_args[:3] + (60, t_args[4])
+    expected = [map_renderer._transform_point(c, *t_args) for c in coords]
+    assert(table.transform(*t_args) == expected)
+    assert(table.pixel_lookup(*t_args)['42'] == expected[42])
+    assert(map_renderer.PointTable([]).bounds() is None)
+
+
+def test_render_map(tmp_path, caplog):
+    """
+    Test render map.
+
+    The layer coordinates extend the bounds of the image, only the
+    saved files are logged
+    """
+    import logging
+
+    from PIL import Image
+
+    output = str(tmp_path / 'map.png')
+    caplog.set_level(logging.INFO, logger='irbt.map_renderer')
+    map_renderer.render_map(_square_map(), io.BytesIO())
+    assert('Map saved' not in caplog.text)
+    assert(map_renderer.render_map(_square_map(), output, width=560,
+                                   show_coverage=True) == output)
+    assert(caplog.text.count('Map saved to %s' % output) == 1)
+    with Image.open(output) as image:
+        # 5 x 3 meters at 88 pixels per meter plus the margins
+        assert(image.size == (560, 384))
+    with pytest.raises(ValueError):
+        map_renderer.render_map({'maps': [{'points2d': []}]}, output)
+
+
+class _Writes(io.BytesIO):
+    # count the writes of the renderer
+    writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+def test_render_map_svg(tmp_path):
+    """
+    Test render map svg.
+
+    The document is written element by element, text or bytes
+    """
+    from xml.etree import ElementTree
+
+    output = _Writes()
+    map_data = _square_map()
+    map_data['maps'][0]['map_header']['name'] = 'Square <&>'
+    assert(map_renderer.render_map(map_data, output, width=560,
+                                   show_coverage=True,
+                                   image_format='svg') is output)
+    assert(output.writes > 5)
+    svg = ElementTree.fromstring(output.getvalue())
+    ns = '{http://www.w3.org/2000/svg}'
+    assert((svg.get('width'), svg.get('height')) == ('560', '384'))
+    # the border and the room
+    assert(len(svg.findall(ns + 'polygon')) == 2)
+    assert(len(svg.findall(ns + 'polyline')) == 1)
+    texts = [text.text for text in svg.findall(ns + 'text')]
+    assert(texts == ['Kitchen', 'Square <&>'])
+    path = str(tmp_path / 'map.svg')
+    map_renderer.render_map(map_data, path, image_format='svg')
+    with open(path, encoding='utf-8') as fh:
+        text = io.StringIO()
+        map_renderer.render_map(map_data, text, image_format='svg')
+        assert(fh.read() == text.getvalue())
+    with pytest.raises(ValueError):
+        map_renderer.render_map(map_data, path, image_format='gif')
+
+    # the coverage squares are written by chunks
+    layer = map_data['maps'][0]['layers'][0]['geometry']
+    layer['coordinates'] = [[1 + i / 1000, 2] for i in range(2000)]
+    output = _Writes()
+    map_renderer.render_map(map_data, output, show_coverage=True,
+                            image_format='svg')
+    assert(output.writes < 20)
+    assert(output.getvalue().count(b'z') >= 2000)
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_coverage_mask(monkeypatch, use_numpy):
+    """
+    Test coverage mask.
+
+    The dilated grid matches a rectangle drawn per point
+    """
+    from PIL import Image, ImageDraw
+
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(map_renderer, 'numpy', None)
+    rng = random.Random(2)
+    coords = [(rng.uniform(-1, 11), rng.uniform(-1, 6)) for _ in range(300)]
+    t_args = (10.0, 0, 0, 0, 50)
+    for point_size in (2, 5, 7):
+        expected = Image.new('L', (100, 50), 0)
+        draw = ImageDraw.Draw(expected)
+        for px, py in map_renderer.PointTable(coords).transform(*t_args):
+            draw.rectangle([px - point_size, py - point_size,
+                            px + point_size, py + point_size], fill=255)
+        columns = map_renderer.PointTable(coords).pixel_columns(*t_args)
+        mask = map_renderer._coverage_mask(columns, (100, 50), point_size)
+        assert(mask.tobytes() == expected.tobytes())
+
+
+@pytest.mark.parametrize('show_coverage', [False, True])
+@pytest.mark.parametrize('tile_size,z,grid', [(128, 2, (4, 3)),
+                                              (100, 1, (2, 2))])
+def test_map_tiles(show_coverage, tile_size, z, grid):
+    """
+    Test map tiles.
+
+    The tiles of a zoom level are crops of the whole map at its width
+    """
+    import io
+
+    from PIL import Image
+
+    def descender_map():
+        # at 100 pixels the descenders reach the tile below the label
+        map_data = _square_map()
+        map_data['maps'][0]['regions'][0]['name'] = 'gyp gyp'
+        return map_data
+
+    tiles = map_renderer.MapTiles(descender_map, tile_size=tile_size,
+                                  show_coverage=show_coverage)
+    output = io.BytesIO()
+    map_renderer.render_map(descender_map(), output,
+                            width=tile_size * 2 ** z,
+                            show_coverage=show_coverage)
+    whole = Image.open(output)
+    assert(tiles.grid(z) == grid)
+    for x in range(grid[0]):
+        for y in range(grid[1]):
+            tile = Image.open(io.BytesIO(tiles.tile(z, x, y)))
+            box = (x * tile_size, y * tile_size, (x + 1) * tile_size,
+                   (y + 1) * tile_size)
+            crop = whole.crop(box)
+            if box[3] > whole.size[1]:
+                # past the bottom of the map
+                tile = tile.crop((0, 0, tile_size, whole.size[1] - box[1]))
+                crop = crop.crop((0, 0, tile_size, whole.size[1] - box[1]))
+            assert(tile.tobytes() == crop.tobytes())
+    for bad in ((z, grid[0], 0), (z, 0, grid[1]), (z, 0, -1), (7, 0, 0)):
+        with pytest.raises(ValueError):
+            tiles.tile(*bad)
+
+
+def test_map_tiles_cache():
+    """
+    Test map tiles cache.
+
+    Cached tiles are neither fetched nor drawn again
+    """
+    from irbt import RenderCache
+
+    cache = RenderCache()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return _square_map()
+
+    tile = map_renderer.MapTiles(fetch, cache=cache, map_id='map',
+                                 version='v1').tile(1, 1, 0)
+    tiles = map_renderer.MapTiles(fetch, cache=cache, map_id='map',
+                                  version='v1')
+    assert(tiles._levels == {})
+    assert(tiles.grid(0) == (1, 1))
+    assert(tiles.tile(1, 1, 0) == tile)
+    assert(len(fetches) == 2)
+    assert(list(tiles._levels) == [0])
+    assert(cache.stats()['hits'] == 1)
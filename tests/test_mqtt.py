@@ -0,0 +1,213 @@
+"""
+Test mqtt connection manager.
+
+Early stage
+"""
+from tests.test_cloud import _logged_cloud
+
+
+def test_mqtt_manager_shares_connections(shadow_clients):
+    """
+    Test mqtt manager connection sharing.
+
+    Robots share a connection up to robots_per_connection
+    """
+    cloud = _logged_cloud(mqtt_robots_per_connection=2)
+    handlers = [cloud.mqtt.acquire(rid) for rid in ('a', 'b', 'c', 'a')]
+    assert(len(shadow_clients) == 2)
+    assert(cloud.mqtt.connections() == 2)
+    assert(handlers[0] is handlers[3])
+    assert(handlers[0].client is handlers[1].client)
+    assert(handlers[2].client is not handlers[0].client)
+    assert(sorted(cloud.mqtt.robots()) == ['a', 'b', 'c'])
+    assert(shadow_clients[0].credentials == [('AKID', 'SECRET', 'TOKEN')])
+
+    cloud.mqtt.release('c')
+    assert(shadow_clients[1].disconnects == 1)
+    cloud.mqtt.release('a')
+    assert(cloud.mqtt.robots() == ['a', 'b'])
+    cloud.mqtt.release('a')
+    cloud.mqtt.release('b')
+    assert(cloud.mqtt.connections() == 0)
+    assert(shadow_clients[0].disconnects == 1)
+    assert(cloud._credentials_listeners == [])
+
+
+def test_mqtt_manager_credentials(shadow_clients):
+    """
+    Test mqtt manager credentials.
+
+    Renewed credentials are given to the connections, reconnect uses them
+    """
+    import time
+
+    cloud = _logged_cloud()
+    cloud.mqtt.acquire('a')
+    cloud._set_credentials('AKID2', 'SECRET2', 'TOKEN2', time.time() + 60)
+    client = shadow_clients[0]
+    assert(client.credentials[-1] == ('AKID2', 'SECRET2', 'TOKEN2'))
+    cloud.mqtt.reconnect('a')
+    assert((client.connects, client.disconnects) == (2, 1))
+    cloud.close()
+    assert(cloud.mqtt.connections() == 0)
+
+
+def test_robot_connect(shadow_clients):
+    """
+    Test robot connection.
+
+    Robots get their shadow handler from the cloud manager, a failed
+    shadowGet reconnects the shared connection
+    """
+    from irbt import Robot
+
+    cloud = _logged_cloud()
+    robots = [Robot(cloud, rid=rid) for rid in ('a', 'b')]
+    robots[0].connect()
+    client = shadow_clients[0]
+    client.fail_gets = 1
+    robots[1].connect()
+    assert(len(shadow_clients) == 1)
+    assert(robots[0].connection is client.connection)
+
+    states = []
+    robots[1].command.dock(print_output=lambda *a: states.append(a[0]))
+    assert(client.connection.published == [
+        ('v011-irbthbu/things/b/cmd', {'state': 'desired',
+                                       'command': 'dock',
+                                       'initiator': 'rmtApp',
+                                       'ordered': 0})])
+    assert((client.connects, client.disconnects) == (2, 1))
+    assert(len(states) == 1)
+
+    for robot in robots:
+        robot.disconnect()
+    assert(cloud.mqtt.connections() == 0)
+
+
+def test_mqtt_manager_reconnect_unlocked(shadow_clients):
+    """
+    Test mqtt manager reconnection.
+
+    The robots are acquired and released while a connection reconnects
+    """
+    import threading
+
+    cloud = _logged_cloud(mqtt_robots_per_connection=1)
+    cloud.mqtt.acquire('a')
+    client = shadow_clients[0]
+    connecting = threading.Event()
+    resume = threading.Event()
+
+    def slow_connect(keep_alive):
+        connecting.set()
+        resume.wait(5)
+        return True
+
+    client.connect = slow_connect
+    reconnect = threading.Thread(target=cloud.mqtt.reconnect, args=('a',))
+    reconnect.start()
+    assert(connecting.wait(5))
+    cloud.mqtt.acquire('b')
+    cloud.mqtt.release('b')
+    assert(cloud.mqtt.robots() == ['a'])
+    assert(reconnect.is_alive())
+    resume.set()
+    reconnect.join(5)
+    assert(client.disconnects == 1)
+    cloud.close()
+
+
+def test_robot_disconnect_once(shadow_clients):
+    """
+    Test robot disconnection.
+
+    Disconnecting a robot twice keeps the connection of another robot
+    with the same id, connecting it twice acquires it once
+    """
+    from irbt import Robot
+
+    cloud = _logged_cloud()
+    robots = [Robot(cloud, rid='a') for _ in range(2)]
+    for robot in robots:
+        robot.connect()
+    robots[0].disconnect()
+    robots[0].disconnect()
+    assert(cloud.mqtt.robots() == ['a'])
+    robots[1].disconnect()
+    assert(cloud.mqtt.connections() == 0)
+    robots[0].connect()
+    robots[0].connect()
+    robots[0].disconnect()
+    assert(cloud.mqtt.connections() == 0)
+
+
+def test_mqtt_manager_delta_subscribers(shadow_clients):
+    """
+    Test mqtt manager delta subscribers.
+
+    The robots of the same id get the deltas through a single sdk
+    callback, unregistered when the last one is released
+    """
+    from irbt import Robot
+
+    cloud = _logged_cloud()
+    # keeps the connection open
+    cloud.mqtt.acquire('b')
+    robots = [Robot(cloud, rid='a') for _ in range(2)]
+    for robot in robots:
+        robot.connect()
+    handler = shadow_clients[0].handlers['a']
+    handler.delta({'batPct': 90})
+    assert([robot.state.document['batPct'] for robot in robots] == [90, 90])
+    assert(handler.registrations == 1)
+
+    robots[0].disconnect()
+    handler.delta({'batPct': 80}, version=3)
+    assert([robot.state.document['batPct'] for robot in robots] == [90, 80])
+    robots[1].disconnect()
+    assert(handler.delta_callback is None)
+    cloud.close()
+
+
+def test_mqtt_manager_connect_unlocked(shadow_clients, monkeypatch):
+    """
+    Test mqtt manager connection opening.
+
+    The robots of the other connections are acquired while one opens,
+    the robots joining it wait for it
+    """
+    import threading
+
+    from tests.mqtt_mock import ShadowClientMock
+
+    cloud = _logged_cloud(mqtt_robots_per_connection=2)
+    connecting = threading.Event()
+    resume = threading.Event()
+    connect = ShadowClientMock.connect
+
+    def slow_connect(client, keep_alive):
+        if client is shadow_clients[0]:
+            connecting.set()
+            resume.wait(5)
+        return connect(client, keep_alive)
+
+    monkeypatch.setattr(ShadowClientMock, 'connect', slow_connect)
+    handlers = {}
+    opening = [threading.Thread(
+        target=lambda rid=rid: handlers.update(
+            {rid: cloud.mqtt.acquire(rid)})) for rid in ('a', 'b')]
+    opening[0].start()
+    assert(connecting.wait(5))
+    opening[1].start()
+    cloud.mqtt.acquire('c')
+    cloud.mqtt.acquire('d')
+    cloud.mqtt.release('c')
+    assert(all(thread.is_alive() for thread in opening))
+    resume.set()
+    for thread in opening:
+        thread.join(5)
+    assert(sorted(handlers) == ['a', 'b'])
+    assert(handlers['a'].client is handlers['b'].client)
+    assert(cloud.mqtt.connections() == 2)
+    cloud.close()
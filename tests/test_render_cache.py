@@ -0,0 +1,82 @@
+"""
+Test render cache.
+
+Early stage
+"""
+from irbt import RenderCache
+
+from tests.test_map_renderer import _square_map
+
+
+def test_render_cache(tmp_path):
+    """
+    Test render cache.
+
+    A map version is drawn once, then served from memory or disk
+    """
+    events = []
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return _square_map()
+
+    cache = RenderCache(str(tmp_path),
+                        on_event=lambda event, key: events.append(event))
+    png = cache.render('map', 'v1', fetch, width=400)
+    assert(png.startswith(b'\x89PNG'))
+    assert(cache.render('map', 'v1', fetch, width=400) == png)
+    assert(len(fetches) == 1)
+    cache.render('map', 'v1', fetch, width=400, show_coverage=True)
+    cache.render('map', 'v2', fetch, width=400)
+    assert(len(fetches) == 3)
+    assert(events == ['miss', 'hit', 'miss', 'miss'])
+    assert(len(list(tmp_path.iterdir())) == 3)
+
+    other = RenderCache(str(tmp_path))
+    assert(other.render('map', 'v1', fetch, width=400) == png)
+    assert(len(fetches) == 3)
+    stats = other.stats()
+    assert((stats['disk_hits'], stats['entries'], stats['bytes']) == (
+        1, 1, len(png)))
+    other.clear()
+    assert(list(tmp_path.iterdir()) == [])
+
+
+def test_render_cache_budget(tmp_path):
+    """
+    Test render cache budget.
+
+    The least recently used images are evicted past the byte budgets
+    """
+    cache = RenderCache(max_bytes=25)
+    for name in 'abc':
+        cache.put(cache.key('map', name), name.encode('utf-8') * 10)
+    assert(cache.get(cache.key('map', 'a')) is None)
+    assert(cache.get(cache.key('map', 'c')) == b'c' * 10)
+    stats = cache.stats()
+    assert((stats['entries'], stats['bytes'], stats['evictions']) == (
+        2, 20, 1))
+
+    cache = RenderCache(str(tmp_path), max_disk_bytes=25)
+    for name in 'abc':
+        cache.put(cache.key('map', name), name.encode('utf-8') * 10)
+    assert(len(list(tmp_path.iterdir())) == 2)
+
+
+def test_robot_map_image(robot, monkeypatch):
+    """
+    Test robot map image.
+
+    The current map version is the cache key
+    """
+    cache = RenderCache()
+    monkeypatch.setattr(robot, 'vector_map', _square_map)
+    png = robot.map_image(width=400, cache=cache)
+    assert(robot.map_image(width=400, cache=cache) == png)
+    assert(list(cache._entries) == [('en12a9_lTglkpPqazxDWED',
+                                     '134043T209849', 400, False)])
+    assert(robot.map_image(width=400) == png)
+    tiles = robot.map_tiles(cache=cache)
+    assert(tiles.tile(0, 0, 0).startswith(b'\x89PNG'))
+    assert(cache.stats()['entries'] == 2)
@@ -319,3 +319,142 @@ def test_robot_vector_map(robot):
     Test robot vector_map
     """
     assert(robot.vector_map() == {})
+
+
+def test_robot_fetch_all(robot, monkeypatch):
+    """
+    Test robot fetch_all.
+
+    Endpoints are retrieved in parallel and failures reported per endpoint
+    """
+    result = robot.fetch_all()
+    assert(result.errors == {})
+    assert(sorted(result.results) == ['evac_history', 'maps', 'missions',
+                                      'timeline', 'vector_map'])
+    assert(result.results['evac_history'] == robot.evac_history())
+
+    result = robot.fetch_all(['missions', 'vector_map'])
+    assert(sorted(result.results) == ['missions', 'vector_map'])
+
+    def timeline():
+        raise Exception('CloudAPIGetError<503>')
+
+    monkeypatch.setattr(robot, 'timeline', timeline)
+    result = robot.fetch_all(['maps', 'timeline'])
+    assert(list(result.results) == ['maps'])
+    assert(str(result.errors['timeline']) == 'CloudAPIGetError<503>')
+
+
+def test_robot_fetch_all_lazy(cloud, monkeypatch):
+    """
+    Test robot fetch_all on a lazy robot.
+
+    The robot id and the maps are retrieved once
+    """
+    import time
+
+    calls = []
+    get = cloud.api.get
+
+    def slow_get(*a, **kw):
+        # long enough for the workers to overlap
+        calls.append(a)
+        time.sleep(0.01)
+        return get(*a, **kw)
+
+    monkeypatch.setattr(cloud.api, 'get', slow_get)
+    result = Robot(cloud).fetch_all(['maps', 'vector_map', 'timeline'])
+    assert(result.errors == {})
+    assert(calls.count(('user', 'associations', 'robots')) == 1)
+    assert(calls.count(('1234ABCD1234ABCD1234ABCD1234ABCD', 'pmaps')) == 1)
+
+
+def test_robot_iter_missions(robot):
+    """
+    Test robot iter_missions.
+
+    Missions are decoded one at a time from the streamed response
+    """
+    missions = list(robot.iter_missions())
+    assert(missions == robot.missions())
+    assert([m['nMssn'] for m in robot.iter_missions(limit=1)] == [183])
+
+
+def test_iter_json_array():
+    """
+    Test iter_json_array.
+
+    Items split across chunks, numbers and non array documents
+    """
+    from irbt.robot import _iter_json_array
+
+    data = '[1, 23, {"a": "é]"}, [4], 567]'.encode('utf-8')
+    chunks = [data[i:i + 1] for i in range(len(data))]
+    assert(list(_iter_json_array(chunks)) == [1, 23, {'a': 'é]'},
+                                              [4], 567])
+    assert(list(_iter_json_array([b' [ ] '])) == [])
+    assert(list(_iter_json_array([b'{"a": ', b'1}'])) == [{'a': 1}])
+    # numbers split in the middle of their token
+    assert(list(_iter_json_array([b'[1.', b'5, 2]'])) == [1.5, 2])
+    assert(list(_iter_json_array([b'[1e', b'3]'])) == [1000.0])
+    assert(list(_iter_json_array([b'[12', b'3]'])) == [123])
+    chunks = [b'[-', b'4', b'.2', b'5e', b'-1', b']']
+    assert(list(_iter_json_array(chunks)) == [-0.425])
+    chunks = [b'[tr', b'ue, nu', b'll]']
+    assert(list(_iter_json_array(chunks)) == [True, None])
+
+
+def test_robot_room_lookups(cloud, monkeypatch):
+    """
+    Test robot room lookups.
+
+    Lookups read the map index without any request
+    """
+    robot = Robot(cloud).prefetch()
+    calls = []
+    get = cloud.api.get
+    monkeypatch.setattr(cloud.api, 'get',
+                        lambda *a, **kw: calls.append(a) or get(*a, **kw))
+    assert(robot.get_room_name('2') == 'Kitchen')
+    assert(robot.get_room_id('kitchen') == '2')
+    assert(robot.get_room_id('Nowhere') is None)
+    payload = robot._make_payload('1,4', 'start')
+    assert(payload['pmap_id'] == 'en12a9_lTglkpPqazxDWED')
+    assert(payload['user_pmapv_id'] == '134043T209849')
+    assert(payload['regions'] == [{'type': 'rid', 'region_id': '1'},
+                                  {'type': 'rid', 'region_id': '4'}])
+    assert(calls == [])
+
+    index = robot.map_index()
+    robot.rooms()
+    assert(len(calls) == 1)
+    assert(robot.map_index() is index)
+    assert(index.name == 'Appartement')
+
+
+def test_robot_lazy(cloud, monkeypatch):
+    """
+    Test lazy robot construction.
+
+    Nothing is retrieved before use, commands do not need the maps
+    """
+    calls = []
+    get = cloud.api.get
+    monkeypatch.setattr(cloud.api, 'get',
+                        lambda *a, **kw: calls.append(a) or get(*a, **kw))
+    robot = Robot(cloud)
+    assert(calls == [])
+    assert(robot._make_payload(None, 'dock')['command'] == 'dock')
+    assert(calls == [])
+
+    assert(robot.prefetch() is robot)
+    assert(calls == [('user', 'associations', 'robots'),
+                     ('1234ABCD1234ABCD1234ABCD1234ABCD', 'pmaps')])
+    assert(robot._current_map_id == 'en12a9_lTglkpPqazxDWED')
+
+    robot = Robot(cloud, rid='1234ABCD1234ABCD1234ABCD1234ABCD')
+    robot.vector_map()
+    assert(calls[2:] == [
+        ('1234ABCD1234ABCD1234ABCD1234ABCD', 'pmaps'),
+        ('1234ABCD1234ABCD1234ABCD1234ABCD', 'pmaps',
+         'en12a9_lTglkpPqazxDWED', 'versions', '134043T209849', 'umf')])
@@ -0,0 +1,259 @@
+"""
+Test shadow mirror.
+
+Early stage
+"""
+import json
+
+from irbt.shadow import ShadowMirror, merge
+
+from tests.test_cloud import _logged_cloud
+
+
+def test_shadow_merge():
+    """
+    Test shadow merge.
+
+    Objects are merged, null removes a key, the input is not modified
+    """
+    document = {'batPct': 90, 'bin': {'full': False, 'present': True},
+                'name': 'Robot'}
+    merged = merge(document, {'bin': {'full': True}, 'name': None,
+                              'batPct': 80})
+    assert(merged == {'batPct': 80, 'bin': {'full': True, 'present': True}})
+    assert(document['bin']['full'] is False)
+
+
+def test_shadow_mirror():
+    """
+    Test shadow mirror.
+
+    Seeded by a shadowGet and updated by the deltas, old versions ignored
+    """
+    mirror = ShadowMirror()
+    assert(mirror.state() == (None, None))
+    mirror.apply(json.dumps({'state': {'batPct': 10}, 'version': 1}))
+    mirror.seed(json.dumps({'state': {'reported': {'batPct': 90}},
+                            'version': 3}))
+    mirror.apply(json.dumps({'state': {'batPct': 10}, 'version': 2}))
+    assert(mirror.state().document == {'batPct': 90})
+    mirror.apply({'state': {'reported': {'batPct': 80}}, 'version': 4})
+    document, age = mirror.state()
+    assert(document == {'batPct': 80})
+    assert(0 <= age < 1)
+    assert(json.loads(mirror.payload()) == {
+        'state': {'reported': {'batPct': 80}}, 'version': 4})
+
+
+def test_robot_state(shadow_clients):
+    """
+    Test robot state.
+
+    One shadowGet and one delta callback, status is read locally
+    """
+    from irbt import Robot
+
+    robot = Robot(_logged_cloud(), rid='a')
+    assert(robot.state == (None, None))
+    robot.connect()
+    handler = shadow_clients[0].handlers['a']
+    assert(robot.state.document == {'batPct': 100})
+
+    outputs = []
+    for _ in range(3):
+        robot.command.status(print_output=lambda *a: outputs.append(a))
+    handler.delta({'batPct': 99, 'bin': {'full': True}})
+    assert(robot.state.document == {'batPct': 99, 'bin': {'full': True}})
+    assert(handler.gets == 1)
+    assert(handler.registrations == 1)
+    assert([status for _, status, _ in outputs] == ['mirror'] * 3 + [
+        'delta/a'])
+    robot.disconnect()
+
+
+def test_robot_send_command(shadow_clients):
+    """
+    Test robot send command.
+
+    The future resolves with the matching lastCommand or times out
+    """
+    import pytest
+
+    from irbt import Robot
+
+    robot = Robot(_logged_cloud(), rid='a')
+    robot.connect()
+    handler = shadow_clients[0].handlers['a']
+    future = robot.send_command('dock', print_output=None)
+    assert(not future.done())
+    handler.delta({'lastCommand': {'command': 'start',
+                                   'initiator': 'rmtApp'}})
+    handler.delta({'lastCommand': {'command': 'dock',
+                                   'initiator': 'schedule'}})
+    assert(not future.done())
+    handler.delta({'lastCommand': {'command': 'dock',
+                                   'initiator': 'rmtApp'}})
+    ack = future.result(0)
+    assert(ack.command == 'dock')
+    assert(ack.state['lastCommand']['initiator'] == 'rmtApp')
+    assert(list(robot.command_latencies) == [ack.latency])
+
+    future = robot.send_command('pause', print_output=None, timeout=0.01)
+    with pytest.raises(TimeoutError):
+        future.result(1)
+    assert(robot._pending_acks == [])
+    assert(robot.send_command('status', print_output=None).result(0)
+           .state == robot.state.document)
+    robot.disconnect()
+
+
+def test_robot_subscribe(shadow_clients):
+    """
+    Test robot subscribe.
+
+    Listeners are registered once and get the decoded delta
+    """
+    from irbt import Robot
+
+    robot = Robot(_logged_cloud(), rid='a')
+    robot.connect()
+    handler = shadow_clients[0].handlers['a']
+    calls = []
+
+    def listener(delta, document):
+        calls.append((delta['state'], document['batPct']))
+
+    def failing(delta, document):
+        raise ValueError('listener error')
+
+    robot.subscribe(failing)
+    robot.subscribe(listener)
+    robot.subscribe(listener)
+    for _ in range(3):
+        robot.command.status(print_output=None)
+    handler.delta({'batPct': 42})
+    assert(calls == [({'batPct': 42}, 42)])
+    assert(handler.registrations == 1)
+
+    robot.unsubscribe(listener)
+    handler.delta({'batPct': 41}, version=3)
+    assert(len(calls) == 1)
+    robot.disconnect()
+
+
+def test_shadow_diff():
+    """
+    Test shadow diff.
+
+    Only the changed fields are kept, removed keys are null
+    """
+    from irbt.shadow import diff
+
+    before = {'batPct': 90, 'pose': {'x': 1, 'y': 2}, 'name': 'Robot'}
+    after = {'batPct': 90, 'pose': {'x': 1, 'y': 3}, 'bin': {'full': True}}
+    assert(diff(before, after) == {'pose': {'y': 3}, 'bin': {'full': True},
+                                   'name': None})
+    assert(diff(after, after) == {})
+
+
+def test_robot_subscribe_window(shadow_clients):
+    """
+    Test robot subscribe window.
+
+    The deltas of a window are coalesced in one delta of the changes
+    """
+    import threading
+
+    from irbt import Robot
+
+    robot = Robot(_logged_cloud(), rid='a')
+    robot.connect()
+    handler = shadow_clients[0].handlers['a']
+    calls = []
+    done = threading.Event()
+
+    def listener(delta, document):
+        calls.append(delta)
+        done.set()
+
+    robot.subscribe(listener, window=0.05)
+    handler.delta({'batPct': 99}, version=2)
+    handler.delta({'pose': {'point': {'x': 1, 'y': 2}}}, version=3)
+    handler.delta({'batPct': 100, 'pose': {'point': {'x': 3}}}, version=4)
+    assert(done.wait(1))
+    assert(calls == [{'state': {'pose': {'point': {'x': 3, 'y': 2}}},
+                      'version': 4}])
+
+    done.clear()
+    handler.delta({'batPct': 98}, version=5)
+    robot.unsubscribe(listener)
+    assert(not done.wait(0.1))
+    assert(len(calls) == 1)
+    robot.disconnect()
+
+
+def test_robot_output_window(shadow_clients):
+    """
+    Test robot output window.
+
+    The deltas of a window are printed once as the reported state, the
+    pending ones when the robot disconnects
+    """
+    import threading
+
+    from irbt import Robot
+
+    robot = Robot(_logged_cloud(), rid='a', output_window=0.05)
+    robot.connect()
+    handler = shadow_clients[0].handlers['a']
+    outputs = []
+    done = threading.Event()
+
+    def print_output(payload, response_status, token):
+        outputs.append((json.loads(payload), response_status))
+        done.set()
+
+    robot.command.status(print_output=print_output)
+    done.clear()
+    handler.delta({'batPct': 99}, version=2)
+    handler.delta({'batPct': 98}, version=3)
+    assert(done.wait(1))
+    assert(outputs[1:] == [({'state': {'reported': {'batPct': 98}},
+                             'version': 3}, 'delta')])
+
+    handler.delta({'batPct': 97}, version=4)
+    robot.disconnect()
+    assert(len(outputs) == 3)
+    assert(outputs[2][0]['state']['reported'] == {'batPct': 97})
+
+
+def test_robot_status_waits_for_seed(shadow_clients):
+    """
+    Test robot status before the shadowGet response.
+
+    The status waits for the response of the get sent by connect, the
+    deltas received before it are kept for the seed
+    """
+    import threading
+
+    from irbt import Robot
+
+    cloud = _logged_cloud()
+    cloud.mqtt.acquire('a')
+    client = shadow_clients[0]
+    client.defer_gets = True
+    robot = Robot(cloud, rid='a')
+    robot.connect()
+    handler = client.handlers['a']
+    assert(handler.pending_gets and not robot._mirror.is_seeded())
+    handler.delta({'bin': {'full': True}}, version=2)
+    assert(not robot._mirror.is_seeded())
+
+    outputs = []
+    threading.Timer(0.05, handler.answer_gets).start()
+    robot.command.status(print_output=lambda *a: outputs.append(a))
+    assert([status for _, status, _ in outputs] == ['accepted'])
+    assert(robot.state.document == {'batPct': 100, 'bin': {'full': True}})
+    assert(robot._mirror.version == 2)
+    robot.disconnect()
+    cloud.close()
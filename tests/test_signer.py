@@ -0,0 +1,79 @@
+"""
+Test signer.
+
+Early stage
+"""
+import datetime
+
+from irbt import signer
+from irbt.signer import SigV4Auth, signing_key
+
+import pytest
+
+import requests
+
+aws_auth = pytest.importorskip('aws_requests_auth.aws_auth')
+
+NOW = datetime.datetime(2019, 10, 21, 8, 30, 15)
+
+
+class FrozenDatetime(datetime.datetime):
+    """Datetime returning a fixed utcnow."""
+
+    @classmethod
+    def utcnow(cls):
+        """Return the frozen time."""
+        return NOW
+
+
+@pytest.mark.parametrize('method,url,body,token', [
+    ('GET', 'https://api.example.com/v1/user/associations/robots',
+     None, 'TOKEN'),
+    ('GET', 'https://api.example.com/v1/rid/pmaps?visible=true'
+     '&activeDetails=1', None, 'TOKEN'),
+    ('POST', 'https://api.example.com/v1/user/associations/robots/rid'
+     '?app_id=IOS-1', b'{"password": "secret"}', None),
+])
+def test_signer_matches_aws_requests_auth(monkeypatch, method, url, body,
+                                          token):
+    """
+    Test signer.
+
+    The headers are the ones of aws_requests_auth
+    """
+    monkeypatch.setattr(aws_auth.datetime, 'datetime', FrozenDatetime)
+    request = requests.Request(method, url, data=body).prepare()
+    reference = aws_auth.AWSRequestsAuth(
+        aws_access_key='AKID', aws_secret_access_key='SECRET',
+        aws_token=token, aws_host='api.example.com',
+        aws_region='us-east-1', aws_service='execute-api')
+    auth = SigV4Auth('AKID', 'SECRET', token, 'api.example.com',
+                     'us-east-1')
+    now = NOW.replace(tzinfo=datetime.timezone.utc).timestamp()
+    headers = auth.sign(method, request.url, request.body, now=now)
+    assert(headers == reference.get_aws_request_headers_handler(request))
+
+
+def test_signing_key_cache(monkeypatch):
+    """
+    Test signing key cache.
+
+    The key is derived once per day by each auth
+    """
+    derived = []
+
+    def counting_signing_key(*args):
+        derived.append(args)
+        return signing_key(*args)
+
+    monkeypatch.setattr(signer, 'signing_key', counting_signing_key)
+    auth = SigV4Auth('AKID', 'SECRET', 'TOKEN', 'api.example.com',
+                     'us-east-1')
+    for _ in range(3):
+        auth.sign('GET', 'https://api.example.com/v1/evachistory',
+                  now=1571646615)
+    auth.sign('GET', 'https://api.example.com/v1/evachistory',
+              now=1571646615 + 86400)
+    assert([args[1] for args in derived] == ['20191021', '20191022'])
+    assert(list(auth._signing_keys) == [('20191022', 'us-east-1',
+                                         'execute-api')])
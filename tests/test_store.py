@@ -0,0 +1,48 @@
+"""
+Test sync store.
+
+Early stage
+"""
+
+from irbt import SyncStore
+
+ROBOT_ID = '1234ABCD1234ABCD1234ABCD1234ABCD'
+
+
+def test_store_sync(robot):
+    """
+    Test store sync.
+
+    Only new records are stored on the next synchronization
+    """
+    store = SyncStore()
+    assert(store.sync(robot) == {'missions': 2, 'evacuations': 0,
+                                 'timeline': 2})
+    assert(store.high_water(ROBOT_ID, 'missions') == 1571613647)
+    # no timestamped evacuation, the whole history is requested again
+    assert(store.high_water(ROBOT_ID, 'evacuations') is None)
+    assert(store.sync(robot) == {'missions': 0, 'evacuations': 0,
+                                 'timeline': 0})
+    store.close()
+
+
+def test_store_queries(robot):
+    """
+    Test store queries.
+
+    Filters by date range, outcome and initiator
+    """
+    store = SyncStore()
+    store.sync(robot)
+
+    def numbers(**kwargs):
+        return [m['nMssn'] for m in store.missions(ROBOT_ID, **kwargs)]
+
+    assert(numbers() == [183, 181])
+    assert(numbers(outcome='ok') == [181])
+    assert(numbers(initiator='ifttt') == [183])
+    assert(numbers(start=1571600000) == [183])
+    assert(store.missions(ROBOT_ID, end=1571565013) == [])
+    assert(len(store.timeline(ROBOT_ID, event_type='HKC')) == 2)
+    assert(store.evacuations(ROBOT_ID) == [])
+    store.close()